@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, "src"))
+
+from models import EndPoint
+from pipeline.client_generator import ClientGenerator
+
+ENDPOINTS = [
+    EndPoint(function="get_item", path="/items/<int:item_id>", params=[{"name": "item_id", "type": "int"},
+                                                                     {"name": "q", "type": "str"}],
+             methods=["GET"], summary="", description="", calls=[], code_snippet=""),
+    EndPoint(function="create_item", path="/items", params=[{"name": "name", "type": "str"}],
+             methods=["POST"], summary="", description="", calls=[], code_snippet=""),
+]
+RESPONSE = b'{"ok": true}'
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 с Content-Length: сервер держит соединение открытым между запросами
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _load_module(name: str, source: str, tmp: str):
+    path = os.path.join(tmp, f"{name}.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _calls(count: int) -> list:
+    return [("get_item", {"item_id": i, "q": "x"}) if i % 2 == 0 else ("create_item", {"name": f"item{i}"})
+            for i in range(count)]
+
+
+def _naive(base_url: str, calls: list, workers: int):
+    # Поведение прежнего клиента: requests.request без общей сессии, новое соединение на каждый вызов
+    import requests
+
+    def send(call):
+        name, kwargs = call
+        if name == "get_item":
+            return requests.request("GET", f"{base_url}/items/{kwargs['item_id']}", params={"q": kwargs["q"]})
+        return requests.request("POST", f"{base_url}/items", json=kwargs)
+
+    if workers == 1:
+        return [send(call) for call in calls]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(send, calls))
+
+
+def _measure(results: dict, name: str, count: int, fn):
+    start = time.perf_counter()
+    responses = fn()
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in responses if getattr(r, "status_code", None) != 200)
+    results[name] = {
+        "seconds": round(elapsed, 4),
+        "requests": count,
+        "failed": failed,
+        "requests_per_second": round(count / elapsed, 1) if elapsed > 0 else None,
+    }
+    print(f"    {name:<18} {elapsed:>8.3f} с  {count / elapsed:>9.1f} запр/с  ошибок {failed}")
+
+
+def main(count: int, workers: int, out: str):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    calls = _calls(count)
+    generator = ClientGenerator(async_client=True)
+    results = {}
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            sync_module = _load_module("bench_client", generator.create_client(ENDPOINTS), tmp)
+            print(f"Запросов: {count}, потоков/одновременных запросов: {workers}")
+
+            _measure(results, "naive_sequential", count, lambda: _naive(base_url, calls, 1))
+            _measure(results, "naive_threads", count, lambda: _naive(base_url, calls, workers))
+            with sync_module.ApiClient(base_url, pool_size=workers) as client:
+                _measure(results, "pooled_sequential", count,
+                         lambda: [getattr(client, name)(**kwargs) for name, kwargs in calls])
+                _measure(results, "pooled_batch", count, lambda: client.batch(calls))
+
+            try:
+                async_module = _load_module("bench_client_async", generator.create_async_client(ENDPOINTS), tmp)
+            except ImportError:
+                print("    httpx не установлен, асинхронный клиент пропущен")
+            else:
+                async def run_async():
+                    async with async_module.AsyncApiClient(base_url, max_concurrency=workers) as client:
+                        return await client.batch(calls)
+
+                _measure(results, "async_batch", count, lambda: asyncio.run(run_async()))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "requests": count,
+        "workers": workers,
+        "results": results,
+    }
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark generated API clients against a local HTTP server.')
+    parser.add_argument('--requests', type=int, default=2000, help='Number of calls per scenario')
+    parser.add_argument('--workers', type=int, default=16, help='Threads / concurrent requests for batch scenarios')
+    parser.add_argument('--out', type=str, default='client_bench_results.json', help='JSON report path')
+
+    args = parser.parse_args()
+    main(args.requests, args.workers, args.out)
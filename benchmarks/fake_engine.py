@@ -0,0 +1,38 @@
+import ast
+import json
+import time
+
+
+class FakeEngine:
+    # Детерминированный движок для GenerationService: отвечает корректным <JSON>
+    # для каждого эндпоинта из промпта с заданной задержкой
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, max_concurrency: int = 8, context_window: int = 8192):
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.context_window = context_window
+        self.engine_id = f"fake:{latency}"
+        self.calls = 0
+
+    def count_tokens(self, text: str) -> int:
+        return len(text) // 4 + 1
+
+    @staticmethod
+    def _endpoints(prompt: list) -> list:
+        payload = prompt[-1]["content"].split("\n", 1)[1]
+        try:
+            return json.loads(payload)
+        except json.JSONDecodeError:
+            return ast.literal_eval(payload)
+
+    def generate(self, prompt: list) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        docs = [{
+            "method": f"{e['methods'][0]} {e['path']}",
+            "summary": f"Endpoint {e['function']}.",
+            "description": f"Handles {e['methods'][0]} requests to {e['path']}.",
+        } for e in self._endpoints(prompt)]
+        return "<JSON>" + json.dumps(docs, ensure_ascii=False) + "</JSON>"
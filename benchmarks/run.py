@@ -0,0 +1,153 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, "src"))
+
+from fake_engine import FakeEngine
+from synthetic_project import generate_project
+from parser import parse_files
+from pipeline.file_collector import FileCollector
+from pipeline.doc_generator import DocGenerator
+from pipeline.openapi_builder import OpenApiBuilder
+from pipeline.client_generator import ClientGenerator
+from pipeline.orchestrator import Orchestrator
+from services.serviceGeneration import GenerationService
+
+SCALES = {
+    "small": dict(files=10, routes_per_file=5, handler_lines=8, depth=2),
+    "medium": dict(files=100, routes_per_file=10, handler_lines=12, depth=3),
+    "large": dict(files=1000, routes_per_file=10, handler_lines=12, depth=4),
+}
+
+
+def _timed(stages: dict):
+    # Проход с замером времени: tracemalloc выключен, иначе он в разы замедляет стадии
+    def measure(name: str, units: int | None, fn):
+        start = time.perf_counter()
+        # Стадии конвейера печатают по строке на файл - в замерах вывод подавляется
+        with contextlib.redirect_stdout(io.StringIO()):
+            value = fn()
+        elapsed = time.perf_counter() - start
+
+        units = units if units is not None else len(value)
+        stages[name] = {
+            "seconds": round(elapsed, 6),
+            "units": units,
+            "throughput": round(units / elapsed, 2) if elapsed > 0 else None,
+        }
+        return value
+    return measure
+
+
+def _traced(stages: dict):
+    # Отдельный проход под tracemalloc: только пиковая память стадий, время здесь не учитывается
+    def measure(name: str, units: int | None, fn):
+        tracemalloc.reset_peak()
+        with contextlib.redirect_stdout(io.StringIO()):
+            value = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        stages[name]["peak_mb"] = round(peak / (1024 * 1024), 3)
+        return value
+    return measure
+
+
+def _run_pipeline(src_dir: str, out_dir: str, latency: float, concurrency: int, jobs: int, measure) -> dict:
+    # Каждый проход собирает конвейер заново и пишет в свой каталог, чтобы проходы не влияли друг на друга
+    os.makedirs(out_dir)
+    engine = FakeEngine(latency=latency, max_concurrency=concurrency)
+    gen = GenerationService("remote", use_cache=False, engine=engine)
+    collector = FileCollector()
+    doc_gen = DocGenerator(gen, max_concurrency=concurrency)
+    openapi_builder = OpenApiBuilder(out_dir)
+    client_generator = ClientGenerator()
+    orchestrator = Orchestrator(collector, doc_gen, openapi_builder, client_generator)
+
+    files = measure("collect", None, lambda: collector.collect(src_dir, ["*.py"]))
+    notation = measure("parse", len(files), lambda: parse_files(files, jobs=jobs))
+    endpoints = sum(len(methods) for _, methods in notation)
+    docs = measure("document", endpoints, lambda: doc_gen.get_documentation(notation))
+    enriched = measure("merge", endpoints, lambda: orchestrator._merge_docs(notation, docs))
+    measure("openapi", len(enriched), lambda: openapi_builder.build(enriched))
+    measure("clients", len(enriched), lambda: client_generator.create_clients(enriched, out_dir))
+    return {"files": len(files), "endpoints": endpoints, "llm_calls": engine.calls}
+
+
+def run_scale(params: dict, latency: float, concurrency: int, jobs: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        src_dir = os.path.join(tmp, "project")
+        generate_project(src_dir, **params)
+
+        stages = {}
+        counts = _run_pipeline(src_dir, os.path.join(tmp, "output_timed"), latency, concurrency, jobs,
+                               _timed(stages))
+        tracemalloc.start()
+        try:
+            _run_pipeline(src_dir, os.path.join(tmp, "output_traced"), latency, concurrency, jobs, _traced(stages))
+        finally:
+            tracemalloc.stop()
+
+        total = sum(stage["seconds"] for stage in stages.values())
+        return {
+            "params": params,
+            **counts,
+            "total_seconds": round(total, 6),
+            "endpoints_per_second": round(counts["endpoints"] / total, 2) if total > 0 else None,
+            "stages": stages,
+        }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT_PATH, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(scales, latency, concurrency, jobs, out):
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency": latency,
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "results": {},
+    }
+
+    for scale in scales:
+        result = run_scale(SCALES[scale], latency, concurrency, jobs)
+        report["results"][scale] = result
+        print(f"[{scale}] файлов: {result['files']}, эндпоинтов: {result['endpoints']}, "
+              f"вызовов LLM: {result['llm_calls']}, всего {result['total_seconds']:.3f} с")
+        for name, stage in result["stages"].items():
+            print(f"    {name:<9} {stage['seconds']:>9.4f} с  {stage['throughput'] or 0:>10.1f} ед/с  "
+                  f"пик {stage['peak_mb']:.2f} МБ")
+
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark pipeline stages on synthetic projects.')
+    parser.add_argument('--scales', type=str, nargs='+', choices=list(SCALES), default=["small", "medium"],
+                        help='Project sizes to benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake LLM latency per call, seconds')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of LLM requests in flight')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of parser processes')
+    parser.add_argument('--out', type=str, default='bench_results.json', help='JSON report path')
+
+    args = parser.parse_args()
+    main(args.scales, args.latency, args.concurrency, args.jobs, args.out)
@@ -0,0 +1,53 @@
+import os
+import random
+
+PARAM_TYPES = ["int", "str", "float", "bool"]
+HTTP_METHODS = ["GET", "POST", "PUT", "DELETE"]
+
+
+def _handler(file_idx: int, route_idx: int, handler_lines: int, helpers: int, rnd: random.Random) -> str:
+    params = [(f"p{k}", rnd.choice(PARAM_TYPES)) for k in range(rnd.randint(0, 3))]
+    path = f"/res{file_idx}/item{route_idx}" + "".join(f"/<{t}:{name}>" for name, t in params)
+    method = rnd.choice(HTTP_METHODS)
+    signature = ", ".join(f"{name}: {t}" for name, t in params)
+
+    lines = [
+        f"@blueprint.route('{path}', methods=['{method}'])",
+        f"def handler_{file_idx}_{route_idx}({signature}):",
+    ]
+    if rnd.random() < 0.5:
+        lines.append(f'    """Handler {route_idx} of module {file_idx}.\n\n    Returns the processed resource."""')
+    for k in range(handler_lines):
+        lines.append(f"    value_{k} = helper_{rnd.randrange(helpers)}({k}, '{route_idx}')")
+    lines.append(f"    return jsonify(db.items.get({', '.join(name for name, _ in params) or 'None'}))")
+    return "\n".join(lines)
+
+
+def _module(file_idx: int, routes: int, handler_lines: int, helpers: int, rnd: random.Random) -> str:
+    parts = [
+        "from flask import Blueprint, jsonify",
+        "",
+        f"blueprint = Blueprint('module_{file_idx}', __name__)",
+        "",
+    ]
+    for h in range(helpers):
+        parts.append(f"def helper_{h}(a, b):\n    result = [str(a) + b for _ in range({h + 1})]\n    return result\n")
+    for r in range(routes):
+        parts.append(_handler(file_idx, r, handler_lines, helpers, rnd) + "\n")
+    return "\n".join(parts)
+
+
+def generate_project(root: str, files: int = 10, routes_per_file: int = 5, handler_lines: int = 8,
+                     depth: int = 2, helpers_per_file: int = 5, seed: int = 0) -> list:
+    # Синтетический Flask-проект: файлы раскладываются по вложенным каталогам глубиной depth
+    rnd = random.Random(seed)
+    paths = []
+    for i in range(files):
+        parts = [f"pkg_{(i >> (2 * level)) % 4}" for level in range(depth)]
+        directory = os.path.join(root, *parts)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"views_{i}.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(_module(i, routes_per_file, handler_lines, helpers_per_file, rnd))
+        paths.append(path)
+    return paths
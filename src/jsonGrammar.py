@@ -0,0 +1,79 @@
+OUTPUT_KEYS = ("method", "summary", "description")
+OPEN_TAG = "<json>"
+CLOSE_TAG = "</json>"
+WHITESPACE = " \t\r\n"
+
+INITIAL_STATE = ("open_tag", 0)
+DONE = "done"
+
+
+def _after_value(ch: str):
+    if ch == ",":
+        return ("key_start", "")
+    if ch == "}":
+        return ("after_obj", "")
+    return None
+
+
+def feed(state: tuple | None, text: str) -> tuple | None:
+    # Конечный автомат для префикса ответа вида <JSON>[{"method": "...", ...}, ...]</JSON>.
+    # Возвращает новое состояние или None, если текст не может продолжать корректный ответ
+    for ch in text:
+        if state is None:
+            return None
+        name, buf = state
+
+        if name in ("open_tag", "close_tag"):
+            tag = OPEN_TAG if name == "open_tag" else CLOSE_TAG
+            if buf == 0 and ch in WHITESPACE:
+                continue
+            if ch.lower() != tag[buf]:
+                return None
+            buf += 1
+            if buf < len(tag):
+                state = (name, buf)
+            else:
+                state = ("arr_open", "") if name == "open_tag" else (DONE, "")
+        elif name == DONE:
+            state = state if ch in WHITESPACE else None
+        elif ch in WHITESPACE and name not in ("key", "str", "str_esc"):
+            continue
+        elif name == "arr_open":
+            state = ("obj_or_end", "") if ch == "[" else None
+        elif name == "obj_or_end":
+            state = ("key_start", "") if ch == "{" else ("close_tag", 0) if ch == "]" else None
+        elif name == "obj_start":
+            state = ("key_start", "") if ch == "{" else None
+        elif name == "key_start":
+            state = ("key", "") if ch == '"' else None
+        elif name == "key":
+            if ch == '"':
+                state = ("colon", "") if buf in OUTPUT_KEYS else None
+            elif any(key.startswith(buf + ch) for key in OUTPUT_KEYS):
+                state = ("key", buf + ch)
+            else:
+                return None
+        elif name == "colon":
+            state = ("val_start", "") if ch == ":" else None
+        elif name == "val_start":
+            state = ("str", "") if ch == '"' else None
+        elif name == "str":
+            if ch == "\\":
+                state = ("str_esc", "")
+            elif ch == '"':
+                state = ("after_val", "")
+            elif ord(ch) < 0x20:
+                return None
+        elif name == "str_esc":
+            state = ("str", "") if ch in '"\\/bfnrtu' else None
+        elif name == "after_val":
+            state = _after_value(ch)
+        elif name == "after_obj":
+            state = ("obj_start", "") if ch == "," else ("close_tag", 0) if ch == "]" else None
+        else:
+            return None
+    return state
+
+
+def is_valid_prefix(text: str) -> bool:
+    return feed(INITIAL_STATE, text) is not None
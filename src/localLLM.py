@@ -1,9 +1,73 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import copy
+import time
+
+import jsonGrammar
+from metrics import metrics
+from transformers import (AutoModelForCausalLM, AutoTokenizer, DynamicCache, LogitsProcessor, LogitsProcessorList,
+                          StoppingCriteria, StoppingCriteriaList)
 import torch
 
 
+class StopOnJsonEnd(StoppingCriteria):
+    # Останавливает строку, как только в сгенерированном хвосте появился </json>:
+    # дальше модель обычно пишет пояснения до EOS, которые всё равно отбрасываются
+    def __init__(self, tokenizer, input_len: int, tail_tokens: int = 8):
+        self.tokenizer = tokenizer
+        self.input_len = input_len
+        self.tail_tokens = tail_tokens
+
+    def __call__(self, input_ids, scores, **kwargs):
+        tails = self.tokenizer.batch_decode(input_ids[:, max(self.input_len, input_ids.shape[1] - self.tail_tokens):],
+                                            skip_special_tokens=True)
+        return torch.tensor([jsonGrammar.CLOSE_TAG in tail.lower() for tail in tails], device=input_ids.device)
+
+
+class JsonShapeLogitsProcessor(LogitsProcessor):
+    # Маскирует кандидатов из top-k, после которых ответ перестаёт быть префиксом
+    # <JSON>[{"method": ..., "summary": ..., "description": ...}]</JSON>
+    def __init__(self, tokenizer, input_len: int, top_k: int = 20):
+        self.tokenizer = tokenizer
+        self.input_len = input_len
+        self.top_k = top_k
+        self.special_ids = set(tokenizer.all_special_ids)
+        self._token_text = {}
+
+    def _text(self, token_id: int) -> str:
+        text = self._token_text.get(token_id)
+        if text is None:
+            text = self._token_text[token_id] = self.tokenizer.decode([token_id])
+        return text
+
+    def __call__(self, input_ids, scores):
+        top_k = min(self.top_k, scores.shape[-1])
+        candidates = torch.topk(scores, top_k, dim=-1).indices.tolist()
+        generated = self.tokenizer.batch_decode(input_ids[:, self.input_len:], skip_special_tokens=True)
+
+        mask = torch.full_like(scores, float("-inf"))
+        for row, (text, row_candidates) in enumerate(zip(generated, candidates)):
+            state = jsonGrammar.feed(jsonGrammar.INITIAL_STATE, text)
+            allowed = []
+            for token_id in row_candidates:
+                if token_id in self.special_ids:
+                    ok = state is not None and state[0] == jsonGrammar.DONE
+                else:
+                    ok = jsonGrammar.feed(state, self._text(token_id)) is not None
+                if ok:
+                    allowed.append(token_id)
+            if not allowed:
+                # Тупик в грамматике: строку не ограничиваем, ответ разберёт DocGenerator
+                mask[row] = 0
+                continue
+            mask[row, allowed] = 0
+        return scores + mask
+
+
 class Local():
-    def __init__(self, repetition_penalty, max_new_tokens, temperature, top_p, num_beams, do_sample):
+    name = "local"
+
+    def __init__(self, repetition_penalty, max_new_tokens, temperature, top_p, num_beams, do_sample, batch_size: int = 4,
+                 prefix_cache: bool = True, context_window: int = 8192, constrained_json: bool = False,
+                 constraint_top_k: int = 20, checkpoint: str = "HuggingFaceTB/SmolLM2-1.7B-Instruct"):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.num_beams = num_beams
         self.repetition_penalty = repetition_penalty
@@ -11,36 +75,112 @@ class Local():
         self.temperature = temperature
         self.top_p = top_p
         self.do_sample = do_sample
+        self.batch_size = batch_size
+        self.prefix_cache = prefix_cache
+        self._prefix = None
+        self.context_window = context_window
+        self.constrained_json = constrained_json
+        self.constraint_top_k = constraint_top_k
 
-        self.checkpoint = "HuggingFaceTB/SmolLM2-1.7B-Instruct"
+        self.checkpoint = checkpoint
+        self.engine_id = f"local:{self.checkpoint}"
         self.tokenizer = AutoTokenizer.from_pretrained(self.checkpoint)
+        # Для causal LM дополняем слева, чтобы генерация продолжала последний токен промпта
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
         self.model = AutoModelForCausalLM.from_pretrained(self.checkpoint).to(self.device)
 
-        self.gen_kwargs = dict(
+        self.decode_kwargs = dict(
             max_new_tokens=max_new_tokens,
-            temperature=temperature,
-            top_p=top_p,
             do_sample=do_sample,
-            pad_token_id=self.tokenizer.pad_token_id,
-            eos_token_id=self.tokenizer.eos_token_id
+            num_beams=num_beams,
+            repetition_penalty=repetition_penalty
         )
+        if do_sample:
+            self.decode_kwargs.update(temperature=temperature, top_p=top_p)
 
-    def generate(self, messages):
-        text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=2048).to(self.device)
-        input_len = inputs["input_ids"].shape[1]
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
 
-        outputs = self.model.generate(
+    def _run(self, inputs):
+        input_len = inputs["input_ids"].shape[1]
+        logits_processor = LogitsProcessorList()
+        if self.constrained_json:
+            logits_processor.append(JsonShapeLogitsProcessor(self.tokenizer, input_len, self.constraint_top_k))
+        return self.model.generate(
             **inputs,
-            max_new_tokens=300,
-            do_sample=False,
-            num_beams=2,
-            repetition_penalty=1.1,
+            **self.decode_kwargs,
+            stopping_criteria=StoppingCriteriaList([StopOnJsonEnd(self.tokenizer, input_len)]),
+            logits_processor=logits_processor,
             pad_token_id=self.tokenizer.pad_token_id,
             eos_token_id=self.tokenizer.eos_token_id
         )
 
-        #raw = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        gen_ids = outputs[0, input_len:]
-        gen_text = self.tokenizer.decode(gen_ids, skip_special_tokens=True)
-        return gen_text
+    def _prefix_state(self, prefix_messages: list):
+        prefix_text = self.tokenizer.apply_chat_template(prefix_messages, tokenize=False, add_generation_prompt=False)
+        if self._prefix is None or self._prefix[0] != prefix_text:
+            prefix_ids = self.tokenizer(prefix_text, return_tensors="pt")["input_ids"].to(self.device)
+            with torch.no_grad(), metrics.span("local_prefix_prefill"):
+                past = self.model(prefix_ids, use_cache=True).past_key_values
+            if not isinstance(past, DynamicCache):
+                past = DynamicCache.from_legacy_cache(past)
+            self._prefix = (prefix_text, prefix_ids, past)
+        return self._prefix
+
+    def _encode_with_prefix(self, messages_list: list, texts: list):
+        # Системное сообщение и few-shot примеры одинаковы для всех чанков:
+        # их past_key_values считаются один раз, а прогоняется только суффикс с эндпоинтами
+        prefix_messages = messages_list[0][:-1]
+        if not prefix_messages or any(m[:-1] != prefix_messages for m in messages_list):
+            return None
+        prefix_text, prefix_ids, past = self._prefix_state(prefix_messages)
+        if not all(text.startswith(prefix_text) for text in texts):
+            return None
+
+        # Паддинг суффиксов оказывается между префиксом и суффиксом и закрыт attention_mask
+        suffixes = self.tokenizer([text[len(prefix_text):] for text in texts], return_tensors="pt", padding=True,
+                                  add_special_tokens=False).to(self.device)
+        batch = len(texts)
+        prefix_ids = prefix_ids.expand(batch, -1)
+        input_ids = torch.cat([prefix_ids, suffixes["input_ids"]], dim=1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids), suffixes["attention_mask"]], dim=1)
+
+        past = copy.deepcopy(past)
+        past.batch_repeat_interleave(batch * self.decode_kwargs["num_beams"])
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "past_key_values": past}
+
+    def _encode(self, messages_list: list, texts: list):
+        inputs = self._encode_with_prefix(messages_list, texts) if self.prefix_cache else None
+        if inputs is None:
+            inputs = self.tokenizer(texts, return_tensors="pt", padding=True).to(self.device)
+        return inputs
+
+    def generate(self, messages):
+        return self.generate_batch([messages], batch_size=1)[0]
+
+    def generate_batch(self, messages_list: list, batch_size: int | None = None) -> list:
+        batch_size = batch_size or self.batch_size
+        texts = [self.tokenizer.apply_chat_template(m, tokenize=False, add_generation_prompt=True) for m in messages_list]
+
+        # Сортировка по длине уменьшает количество паддинга внутри микро-батча
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results = [None] * len(texts)
+
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            inputs = self._encode([messages_list[i] for i in idx], [texts[i] for i in idx])
+            input_len = inputs["input_ids"].shape[1]
+
+            t0 = time.perf_counter()
+            outputs = self._run(inputs)
+            metrics.observe("local_batch_seconds", time.perf_counter() - t0)
+            metrics.inc("prompt_tokens", int(inputs["attention_mask"].sum()), labels={"engine": self.name})
+            gen_ids = outputs[:, input_len:]
+            completion_tokens = int((gen_ids != self.tokenizer.pad_token_id).sum())
+            metrics.inc("completion_tokens", completion_tokens, labels={"engine": self.name})
+
+            for row, i in enumerate(idx):
+                results[i] = self.tokenizer.decode(gen_ids[row], skip_special_tokens=True)
+
+        return results
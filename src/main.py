@@ -1,31 +1,141 @@
 import argparse
+import json
+import os
 
+from pipeline.daemon import COMMANDS, WatchDaemon, send_command
 from pipeline.file_collector import FileCollector
 from pipeline.doc_generator import DocGenerator
+from pipeline.doc_policy import POLICIES
 from pipeline.openapi_builder import OpenApiBuilder
 from pipeline.client_generator import ClientGenerator
+from pipeline.ir_store import DocCheckpoint, load_ir, write_ir
 from pipeline.orchestrator import Orchestrator
+from pipeline.parse_cache import ParseCache, project_cache_path
+from metrics import metrics
 from services.serviceGeneration import GenerationService
 
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("parse", "document", "build", "all")
 
 
-def main(path, patterns, mode, output_dir=""):
+def main(path, patterns, mode, output_dir="", use_cache=True, clear_cache=False, incremental=False,
+         jobs=1, concurrency=4, stream=False, exclude=None, use_gitignore=True, prescan=False,
+         metrics_path=None, prometheus_path=None, doc_policy="augment", rag=False,
+         dedupe=False, stage="all", ir_path=None, watch=False, control_port=8765, async_client=False,
+         merged_spec=False):
+    if metrics_path or prometheus_path:
+        metrics.enable()
 
-    collector = FileCollector()
-    gen_service = GenerationService(mode)
-    doc_gen = DocGenerator(gen_service, max_batch=2)
-    openapi_builder = OpenApiBuilder(output_dir)
-    client_generator = ClientGenerator()
+    collector = FileCollector(exclude=exclude, use_gitignore=use_gitignore, prescan=prescan)
+    gen_service = GenerationService(mode, use_cache=use_cache, clear_cache=clear_cache)
+    doc_gen = DocGenerator(gen_service, max_concurrency=concurrency, policy=doc_policy, dedupe=dedupe)
+    openapi_builder = OpenApiBuilder(output_dir, merged=merged_spec)
+    client_generator = ClientGenerator(async_client=async_client)
+    parse_cache = ParseCache(project_cache_path(os.path.join(ROOT_PATH, '.cache', 'parse'), path)) if incremental else None
+    rag_index = None
+    if rag:
+        from services.ragIndex import RagIndex
+        rag_settings = gen_service.rag_settings
+        rag_index = RagIndex(os.path.join(ROOT_PATH, rag_settings["dir"]), rag_settings["model"],
+                             top_k=rag_settings["top_k"], batch_size=rag_settings["batch_size"],
+                             max_body_lines=rag_settings["max_body_lines"], max_body_chars=rag_settings["max_body_chars"])
 
-    orchestrator = Orchestrator(collector, doc_gen, openapi_builder, client_generator)
-    orchestrator.run(path, patterns, output_dir)
+    orchestrator = Orchestrator(collector, doc_gen, openapi_builder, client_generator, parse_cache=parse_cache,
+                                parse_jobs=jobs, rag_index=rag_index)
+    if watch:
+        # Модель и состояние проекта остаются в памяти между запусками
+        WatchDaemon(orchestrator, path, patterns, output_dir).serve_forever(control_port)
+    elif stream:
+        orchestrator.run_streaming(path, patterns, output_dir)
+    elif stage == "all" and not ir_path:
+        orchestrator.run(path, patterns, output_dir)
+    else:
+        # Стадии обмениваются IR-файлом: parse можно выполнить на одной машине, а document - на другой
+        if stage in ("parse", "all"):
+            notation = orchestrator.parse_stage(path, patterns)
+            write_ir(ir_path, notation)
+            print(f"IR сохранён в {ir_path}")
+        else:
+            notation = load_ir(ir_path)
+        if stage in ("document", "all"):
+            checkpoint = DocCheckpoint(ir_path + ".docs.jsonl")
+            notation = orchestrator.document_stage(notation, checkpoint=checkpoint)
+            write_ir(ir_path, notation, stage="document")
+            checkpoint.remove()
+            print(f"IR с документацией сохранён в {ir_path}")
+        if stage in ("build", "all"):
+            orchestrator.build_stage(notation, output_dir)
+
+    gen_service.save_state()
+    if gen_service.cache.enabled:
+        stats = gen_service.cache.stats()
+        print(f"Кэш LLM: попаданий {stats['hits']}, промахов {stats['misses']}")
+
+    if metrics_path:
+        metrics.write_json(metrics_path)
+        print(f"Метрики сохранены в {metrics_path}")
+    if prometheus_path:
+        metrics.write_prometheus(prometheus_path)
+        print(f"Метрики Prometheus сохранены в {prometheus_path}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Generate OpenAPI documentation from Python files.')
-    parser.add_argument('--path', type=str, required=True, help='Root directory for file search')
-    parser.add_argument('--patterns', type=str, nargs='+', required=True, help='File patterns (e.g. "*.py")')
-    parser.add_argument('--mode', type=str, choices=['local', 'remote', 'auto'], required=True, help='Mode of generation')
-    parser.add_argument('--o', type=str, required=True, help='Root directory for output files save')
+    parser.add_argument('--path', type=str, help='Root directory for file search')
+    parser.add_argument('--patterns', type=str, nargs='+', help='File patterns (e.g. "*.py")')
+    parser.add_argument('--mode', type=str, choices=['local', 'remote', 'auto'], help='Mode of generation')
+    parser.add_argument('--o', type=str, help='Root directory for output files save')
+    parser.add_argument('--stage', type=str, choices=STAGES, default='all',
+                        help='Pipeline stage to run; parse, document and build exchange the --ir artifact')
+    parser.add_argument('--ir', type=str, help='Path of the intermediate representation file (JSONL)')
+    parser.add_argument('--merged-spec', action='store_true',
+                        help='Write a single openapi.yaml with the paths of all files instead of one spec per file')
+    parser.add_argument('--async-client', action='store_true',
+                        help='Also generate an asyncio client (<name>_async.py, requires httpx)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running, watch the source tree and regenerate outputs of changed files')
+    parser.add_argument('--control-port', type=int, default=8765, help='Localhost port of the watch mode control socket')
+    parser.add_argument('--send', type=str, choices=COMMANDS, help='Send a command to a running watch process and exit')
+    parser.add_argument('--doc-policy', type=str, choices=POLICIES, default='augment',
+                        help='Which endpoints are sent to the LLM depending on their existing docstrings')
+    parser.add_argument('--dedupe', action='store_true', help='Generate docs once per group of structurally identical endpoints')
+    parser.add_argument('--rag', action='store_true', help='Add bodies of related project functions to prompts')
+    parser.add_argument('--exclude', type=str, nargs='*', default=[], help='Gitignore-style patterns to skip')
+    parser.add_argument('--no-gitignore', action='store_true', help='Do not apply .gitignore rules while collecting files')
+    parser.add_argument('--prescan', action='store_true', help='Skip files that do not mention "route" before parsing')
+    parser.add_argument('--metrics', type=str, help='Write a JSON metrics report to this path')
+    parser.add_argument('--prometheus', type=str, help='Write metrics in Prometheus text format to this path')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the LLM response cache')
+    parser.add_argument('--clear-cache', action='store_true', help='Clear the LLM response cache before run')
+    parser.add_argument('--incremental', action='store_true', help='Reuse parsed endpoints of unchanged files')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of parser processes (0 - all CPU cores)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of LLM requests in flight')
+    parser.add_argument('--stream', action='store_true', help='Process files one by one and write outputs as soon as they are ready')
 
     args = parser.parse_args()
-    main(args.path, args.patterns, args.mode, args.o)
\ No newline at end of file
+    if args.send:
+        try:
+            response = send_command(args.send, args.control_port)
+        except OSError as e:
+            raise SystemExit(f"Не удалось подключиться к 127.0.0.1:{args.control_port}: {e}")
+        print(json.dumps(response, ensure_ascii=False, indent=2))
+        raise SystemExit(0)
+    required = {
+        "parse": ("path", "patterns", "ir"),
+        "document": ("mode", "ir"),
+        "build": ("o", "ir"),
+        "all": ("path", "patterns", "mode", "o"),
+    }[args.stage]
+    missing = [name for name in required if not getattr(args, name)]
+    if missing:
+        parser.error(f"--stage {args.stage} requires: " + ", ".join(f"--{name}" for name in missing))
+    if (args.stream or args.watch) and (args.stage != "all" or args.ir):
+        parser.error("--stream and --watch can only be used with --stage all and without --ir")
+    if args.merged_spec and (args.stream or args.watch):
+        parser.error("--merged-spec needs all files at once and cannot be used with --stream or --watch")
+    main(args.path, args.patterns, args.mode, args.o, use_cache=not args.no_cache, clear_cache=args.clear_cache,
+         incremental=args.incremental, jobs=args.jobs, concurrency=args.concurrency,
+         stream=args.stream, exclude=args.exclude, use_gitignore=not args.no_gitignore, prescan=args.prescan,
+         metrics_path=args.metrics, prometheus_path=args.prometheus, doc_policy=args.doc_policy,
+         rag=args.rag, dedupe=args.dedupe, stage=args.stage, ir_path=args.ir, watch=args.watch,
+         control_port=args.control_port, async_client=args.async_client,
+         merged_spec=args.merged_spec)
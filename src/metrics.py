@@ -0,0 +1,124 @@
+import contextlib
+import json
+import threading
+import time
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, float("inf"))
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def _key(name: str, labels: dict | None) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{inner}}}"
+
+
+class Metrics:
+    # Пока сбор выключен, все методы сразу возвращаются и почти ничего не стоят
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.spans = {}
+        self.counters = {}
+        self.histograms = {}
+
+    def enable(self):
+        self.enabled = True
+        self._started = time.perf_counter()
+
+    def inc(self, name: str, value: float = 1, labels: dict | None = None):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict | None = None, buckets=LATENCY_BUCKETS):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"count": 0, "sum": 0.0, "buckets": {b: 0 for b in buckets}}
+            hist["count"] += 1
+            hist["sum"] += value
+            for bound in hist["buckets"]:
+                if value <= bound:
+                    hist["buckets"][bound] += 1
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name)
+
+    @contextlib.contextmanager
+    def _span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                span = self.spans.setdefault(name, {"count": 0, "seconds": 0.0})
+                span["count"] += 1
+                span["seconds"] += elapsed
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            endpoints = self.counters.get("endpoints_total", 0)
+            return {
+                "elapsed_seconds": round(elapsed, 6),
+                "endpoints_per_second": round(endpoints / elapsed, 3) if elapsed > 0 else None,
+                "spans": {k: {"count": v["count"], "seconds": round(v["seconds"], 6)} for k, v in self.spans.items()},
+                "counters": dict(self.counters),
+                "histograms": {k: {"count": v["count"], "sum": round(v["sum"], 6),
+                                   "buckets": {("+Inf" if b == float("inf") else str(b)): c
+                                               for b, c in v["buckets"].items()}}
+                               for k, v in self.histograms.items()},
+            }
+
+    def write_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+    def write_prometheus(self, path: str):
+        report = self.report()
+        lines = [
+            "# TYPE apigen_elapsed_seconds gauge",
+            f"apigen_elapsed_seconds {report['elapsed_seconds']}",
+            "# TYPE apigen_endpoints_per_second gauge",
+            f"apigen_endpoints_per_second {report['endpoints_per_second'] or 0}",
+            "# TYPE apigen_stage_seconds counter",
+        ]
+        for name, span in report["spans"].items():
+            lines.append(f'apigen_stage_seconds{{stage="{name}"}} {span["seconds"]}')
+        typed = set()
+        for key, value in report["counters"].items():
+            name = key.partition("{")[0]
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE apigen_{name} counter")
+            lines.append(f"apigen_{key} {value}")
+        for key, hist in report["histograms"].items():
+            name, _, labels = key.partition("{")
+            labels = labels.rstrip("}")
+            sep = "," if labels else ""
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE apigen_{name} histogram")
+            for bound, count in hist["buckets"].items():
+                lines.append(f'apigen_{name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"apigen_{name}_sum{suffix} {hist['sum']}")
+            lines.append(f"apigen_{name}_count{suffix} {hist['count']}")
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+metrics = Metrics()
@@ -1,7 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
-@dataclass
+@dataclass(slots=True)
 class EndPoint:
     function: str
     path: str
@@ -11,3 +11,5 @@ class EndPoint:
     description: str
     calls: list[str]
     code_snippet: str
+    context: list[str] = field(default_factory=list)
+    fingerprint: str = ""
@@ -1,5 +1,13 @@
 import ast
-from typing import List, Tuple
+import hashlib
+import os
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+from metrics import metrics
 from models import EndPoint
 
 
@@ -34,14 +42,14 @@ def get_decorator_name(dec: ast.AST) -> str:
     return ""
 
 
-def get_optimized_snippet(node: ast.FunctionDef, max_lines: int = 10, max_length: int = 300) -> str:
-    source = ast.unparse(node)
-    lines = source.split('\n')
+HTTP_METHODS = {"get", "post", "put", "patch", "delete", "head", "options"}
 
-    if len(lines) <= max_lines and len(source) <= max_length:
-        return source
 
-    snippet_lines = lines[:max_lines]
+def get_optimized_snippet(node: ast.AST, lines: List[str], max_lines: int = 10, max_length: int = 300) -> str:
+    # Фрагмент вырезается из исходного текста по номерам строк узла, без ast.unparse
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    end = min(node.end_lineno, start + max_lines - 1)
+    snippet_lines = textwrap.dedent('\n'.join(lines[start - 1:end])).split('\n')
     snippet = '\n'.join(snippet_lines)
 
     if len(snippet) > max_length:
@@ -49,45 +57,139 @@ def get_optimized_snippet(node: ast.FunctionDef, max_lines: int = 10, max_length
 
     return snippet
 
-def parse_file(filename: str):
+
+def extract_params(node: ast.FunctionDef | ast.AsyncFunctionDef) -> List[dict]:
+    params = []
+    for arg in node.args.args:
+        if arg.arg in ("self", "cls"):
+            continue
+        ann = None
+        if arg.annotation:
+            if isinstance(arg.annotation, ast.Name):
+                ann = arg.annotation.id
+            elif isinstance(arg.annotation, ast.Attribute):
+                ann = arg.annotation.attr
+            else:
+                ann = ast.unparse(arg.annotation)
+        params.append({"name": arg.arg, "type": ann})
+    return params
+
+
+def structural_fingerprint(node: ast.FunctionDef | ast.AsyncFunctionDef, methods: List[str], params: List[dict]) -> str:
+    # Каноническая форма обработчика: типы узлов AST, имена вызываемых функций, атрибутов и параметров.
+    # Локальные переменные заменяются порядковыми номерами, литералы - типами значений; декораторы
+    # и docstring не учитываются. Добавляются HTTP-методы и типы параметров.
+    # Имена вызовов остаются в отпечатке: list_users() и health() с одинаковой структурой
+    # делают разное и не должны получать общую документацию
+    parts = []
+
+    body = node.body
+    if ast.get_docstring(node) is not None:
+        body = body[1:]
+
+    arg_names = {a.arg for a in ast.walk(node.args) if isinstance(a, ast.arg)}
+    local_names = {}
+    for stmt in body:
+        for n in ast.walk(stmt):
+            if isinstance(n, ast.Name) and isinstance(n.ctx, (ast.Store, ast.Del)):
+                name = n.id
+            elif isinstance(n, ast.ExceptHandler) and n.name:
+                name = n.name
+            else:
+                continue
+            if name not in arg_names:
+                local_names.setdefault(name, f"${len(local_names)}")
+
+    def walk(n: ast.AST):
+        parts.append(type(n).__name__)
+        if isinstance(n, ast.Constant):
+            parts.append(type(n.value).__name__)
+            return
+        for field_name, value in ast.iter_fields(n):
+            if field_name in ("decorator_list", "ctx", "type_comment"):
+                continue
+            if isinstance(value, list):
+                parts.append("[")
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        walk(item)
+                    elif isinstance(item, str):
+                        parts.append(local_names.get(item, item))
+                parts.append("]")
+            elif isinstance(value, ast.AST):
+                walk(value)
+            elif isinstance(value, str):
+                local = isinstance(n, ast.Name) or (isinstance(n, ast.ExceptHandler) and field_name == "name")
+                parts.append(local_names.get(value, value) if local else value)
+
+    walk(node.args)
+    for stmt in body:
+        walk(stmt)
+
+    parts.append("|" + ",".join(methods))
+    parts.append("|" + ",".join(str(p.get("type")) for p in params))
+    return hashlib.sha1(" ".join(parts).encode("utf-8")).hexdigest()
+
+
+class RouteVisitor(ast.NodeVisitor):
+    # Обходит только операторы (тела модулей, классов, функций и блоков), не заходя в выражения,
+    # и анализирует лишь функции с декоратором route и class-based views
+    def __init__(self, lines: List[str], fingerprints: bool = False):
+        self.lines = lines
+        # Отпечаток нужен только --dedupe, а обход всего AST обработчика заметно замедляет разбор
+        self.fingerprints = fingerprints
+        self.endpoints = []
+
+    def generic_visit(self, node):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.stmt, ast.excepthandler, ast.match_case)):
+                self.visit(child)
+
+    def _routes(self, node) -> list:
+        result = []
+        for decorator in node.decorator_list:
+            if get_decorator_name(decorator) == "route":
+                result.append(extract_route_info(decorator) if isinstance(decorator, ast.Call) else (None, None))
+        return result
+
+    def _add_endpoint(self, node, path, methods, function: str):
+        doc = ast.get_docstring(node) or ""
+        doc_lines = doc.strip().splitlines()
+        summary = doc_lines[0] if doc_lines else ""
+        description = '\n'.join(doc_lines[1:]).strip()
+        methods = methods or ["GET"]
+        params = extract_params(node)
+        self.endpoints.append(EndPoint(function=function, path=path or "/<unknown>", methods=methods,
+                                       summary=summary, params=params,
+                                       calls=extract_calls_from_function(node),
+                                       code_snippet=get_optimized_snippet(node, self.lines), description=description,
+                                       fingerprint=structural_fingerprint(node, methods, params)
+                                       if self.fingerprints else ""))
+
+    def visit_FunctionDef(self, node):
+        for path, methods in self._routes(node):
+            self._add_endpoint(node, path, methods, node.name)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        # Flask-RESTX / MethodView: маршрут на классе, HTTP-методы - методы класса get/post/...
+        for path, _ in self._routes(node):
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name in HTTP_METHODS:
+                    self._add_endpoint(item, path, [item.name.upper()], f"{node.name}_{item.name}")
+        self.generic_visit(node)
+
+
+def parse_file(filename: str, fingerprints: bool = False):
     with open(filename) as file:
         content = file.read()
 
     tree = ast.parse(content)
-    endpoints = []
-
-    for node in ast.walk(tree):
-        if isinstance(node, ast.FunctionDef):
-            function_calls = extract_calls_from_function(node)
-
-            for decorator in node.decorator_list:
-                name = get_decorator_name(decorator)
-                if name == "route":
-                    if isinstance(decorator, ast.Call):
-                        path, methods = extract_route_info(decorator)
-                    else:
-                        path, methods = None, None
-
-                    doc = ast.get_docstring(node) or ""
-                    summary = doc.strip().splitlines()[0] if doc else ""
-                    description = doc.strip().splitlines()[1:] if doc else ""
-                    params = []
-                    for arg in node.args.args:
-                        if arg.arg == "self":
-                            continue
-                        ann = None
-                        if arg.annotation:
-                            if isinstance(arg.annotation, ast.Name):
-                                ann = arg.annotation.id
-                            elif isinstance(arg.annotation, ast.Attribute):
-                                ann = arg.annotation.attr
-                            else:
-                                ann = ast.unparse(arg.annotation)
-                        params.append({"name": arg.arg, "type": ann})
-                    endpoints.append(EndPoint(function=node.name, path=path or "/<unknown>",methods=methods or ["GET"],
-                                              summary=summary,params=params, calls=function_calls, code_snippet=get_optimized_snippet(node), description=description))
-
-    return endpoints
+    visitor = RouteVisitor(content.splitlines(), fingerprints)
+    visitor.visit(tree)
+    return visitor.endpoints
 
 
 def extract_calls_from_function(func_node):
@@ -111,12 +213,86 @@ def extract_calls_from_function(func_node):
 
     return calls
 
-def parse_files(file_dirs: List[str]) -> List[Tuple[str, list]]:
-    result = []
-    for file_dir in file_dirs:
-        endpoints = parse_file(file_dir)
+def _safe_parse_file(filename: str, fingerprints: bool = False):
+    try:
+        return parse_file(filename, fingerprints), None
+    except (SyntaxError, ValueError, UnicodeDecodeError, OSError) as e:
+        return None, e
+
+
+def output_name(file_dir: str, base_dir: str | None = None) -> str:
+    # Путь относительно корня проекта: одноимённые модули из разных пакетов (a/views.py, b/views.py)
+    # не сливаются и раскладываются по тем же подкаталогам в папке выхода
+    if not base_dir:
+        return os.path.basename(file_dir)
+    return Path(os.path.relpath(file_dir, base_dir)).as_posix()
+
+
+def _parse_batch(batch: List[str], cache, jobs: int, get_pool, base_dir: str | None,
+                 fingerprints: bool) -> Iterator[Tuple[str, list]]:
+    parsed = {}
+    pending = []
+    for file_dir in batch:
+        endpoints = cache.get(file_dir, fingerprints) if cache else None
+        if endpoints is None:
+            pending.append(file_dir)
+        else:
+            parsed[file_dir] = endpoints
+
+    if jobs > 1 and len(pending) > 1:
+        chunksize = max(1, len(pending) // (jobs * 4))
+        outcomes = list(get_pool().map(partial(_safe_parse_file, fingerprints=fingerprints), pending,
+                                       chunksize=chunksize))
+    else:
+        outcomes = [_safe_parse_file(file_dir, fingerprints) for file_dir in pending]
+
+    for file_dir, (endpoints, error) in zip(pending, outcomes):
+        if error is not None:
+            print(f"Ошибка разбора файла {file_dir}: {error}")
+            metrics.inc("parse_failures")
+            continue
+        parsed[file_dir] = endpoints
+        if cache:
+            cache.put(file_dir, endpoints, fingerprints)
+
+    for file_dir in batch:
+        endpoints = parsed.get(file_dir)
         if endpoints:
-            file_name = file_dir.split("\\")[-1]
-            result.append((file_name, endpoints))
+            yield output_name(file_dir, base_dir), endpoints
+
+
+def iter_parse_files(file_dirs: Iterable[str], cache=None, jobs: int = 1, batch_size: int | None = None,
+                     base_dir: str | None = None, fingerprints: bool = False) -> Iterator[Tuple[str, list]]:
+    jobs = jobs or os.cpu_count() or 1
+    pool = None
+    seen = []
+
+    def get_pool():
+        nonlocal pool
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=jobs)
+        return pool
+
+    file_dirs = iter(file_dirs)
+    try:
+        while True:
+            batch = list(islice(file_dirs, batch_size)) if batch_size else list(file_dirs)
+            if not batch:
+                break
+            seen.extend(batch)
+            yield from _parse_batch(batch, cache, jobs, get_pool, base_dir, fingerprints)
+            if not batch_size:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if cache:
+        cache.prune(seen)
+        cache.save()
+        print(f"Разбор файлов: из кэша {cache.hits}, заново {cache.misses}")
+
 
-    return result
+def parse_files(file_dirs: List[str], cache=None, jobs: int = 1, base_dir: str | None = None,
+                fingerprints: bool = False) -> List[Tuple[str, list]]:
+    return list(iter_parse_files(file_dirs, cache=cache, jobs=jobs, base_dir=base_dir, fingerprints=fingerprints))
@@ -1,63 +1,190 @@
 import textwrap
 
+from metrics import metrics
 from models import EndPoint
+from pipeline.utils import write_if_changed
 import os
 import re
 
 CLIENT_BASE = """
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+QUERY_METHODS = ("GET", "HEAD", "DELETE", "OPTIONS")
+
 
 class ApiClient:
-    def __init__(self, base_url: str):
-        self.base_url = base_url
+    def __init__(self, base_url: str, pool_size: int = 10, timeout: float = 10.0, retries: int = 3,
+                 backoff: float = 0.3):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        # Одна сессия на клиента: соединения переиспользуются (keep-alive) из пула размера pool_size
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
 
-    def __send(self, path: str, method: str):
-        return requests.request(method, self.base_url + path)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __send(self, path: str, method: str, params: dict | None = None):
+        params = {{k: v for k, v in (params or {{}}).items() if v is not None}} or None
+        if method in QUERY_METHODS:
+            return self.session.request(method, self.base_url + path, params=params, timeout=self.timeout)
+        return self.session.request(method, self.base_url + path, json=params, timeout=self.timeout)
+
+    def batch(self, calls: list, max_workers: int | None = None) -> list:
+        # calls - список пар (имя метода, словарь аргументов); ответы возвращаются в том же порядке
+        with ThreadPoolExecutor(max_workers=max_workers or self.pool_size) as pool:
+            return list(pool.map(lambda call: getattr(self, call[0])(**call[1]), calls))
+    {methods}
+""".strip()
+
+ASYNC_CLIENT_BASE = """
+import asyncio
+
+import httpx
+
+QUERY_METHODS = ("GET", "HEAD", "DELETE", "OPTIONS")
+
+
+class AsyncApiClient:
+    def __init__(self, base_url: str, max_concurrency: int = 50, timeout: float = 10.0, retries: int = 3):
+        self.base_url = base_url.rstrip('/')
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        # retries транспорта повторяют только неудавшиеся подключения
+        transport = httpx.AsyncHTTPTransport(limits=limits, retries=retries)
+        self.client = httpx.AsyncClient(transport=transport, timeout=timeout)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def __send(self, path: str, method: str, params: dict | None = None):
+        params = {{k: v for k, v in (params or {{}}).items() if v is not None}} or None
+        async with self.semaphore:
+            if method in QUERY_METHODS:
+                return await self.client.request(method, self.base_url + path, params=params)
+            return await self.client.request(method, self.base_url + path, json=params)
+
+    async def batch(self, calls: list) -> list:
+        # calls - список пар (имя метода, словарь аргументов); одновременно выполняется
+        # не больше max_concurrency запросов
+        return await asyncio.gather(*(getattr(self, name)(**kwargs) for name, kwargs in calls))
     {methods}
 """.strip()
 
 METHOD_TEMPLATE = """
 def {method_name}(self{params}):
-    \"\"\"{summary}\"\"\"
-    \"\"\"{description}\"\"\"
-    return self.__send(f'{path}', '{method}')
+{docstring}    return self.__send(f'{path}', '{method}'{payload})
+"""
+
+ASYNC_METHOD_TEMPLATE = """
+async def {method_name}(self{params}):
+{docstring}    return await self.__send(f'{path}', '{method}'{payload})
 """
 
+# Аннотации, которые можно выписать в клиенте без импортов из исходного проекта
+CLIENT_TYPES = ("int", "float", "str", "bool", "list", "dict")
+
+
 class ClientGenerator:
+    def __init__(self, async_client: bool = False):
+        self.async_client = async_client
+        self.written = 0
+        self.unchanged = 0
+
     def create_clients(self, api_files: list, output_dir: str):
+        self.written = self.unchanged = 0
         for api_file in api_files:
             file_name, endpoints = api_file
-            with open(os.path.join(output_dir, file_name), 'w', encoding='utf-8') as f:
-                f.write(self.create_client(endpoints))
-            f.close()
+            self.create_client_file(file_name, endpoints, output_dir)
+        if self.unchanged:
+            print(f"Клиентов без изменений: {self.unchanged}, перезаписано: {self.written}")
+
+    def _write(self, output_dir: str, file_name: str, content: str):
+        # Неизменённый клиент не перезаписывается, чтобы не сбрасывать mtime для последующих сборок
+        if write_if_changed(os.path.join(output_dir, file_name), content):
+            self.written += 1
+            metrics.inc("outputs_written", labels={"kind": "client"})
             print(f'Файл {file_name} создан')
+        else:
+            self.unchanged += 1
+            metrics.inc("outputs_unchanged", labels={"kind": "client"})
+
+    def create_client_file(self, file_name: str, endpoints: list[EndPoint], output_dir: str):
+        self._write(output_dir, file_name, self.create_client(endpoints))
+        if self.async_client:
+            self._write(output_dir, f'{os.path.splitext(file_name)[0]}_async.py', self.create_async_client(endpoints))
 
     def format_path(self, path: str) -> str:
-        pattern = r'<([a-zA-Z]+):([a-zA-Z0-9_]+)>'
+        # Flask: <int:id> и <id> -> {id}; пути FastAPI уже в нужном виде
+        pattern = r'<(?:[a-zA-Z]+:)?([a-zA-Z0-9_]+)>'
 
         def replace_match(match):
-            return f'{{{match.group(2)}}}'
+            return f'{{{match.group(1)}}}'
 
         return re.sub(pattern, replace_match, path)
 
+    @staticmethod
+    def _docstring(e: EndPoint) -> str:
+        text = '\n\n'.join(part for part in (e.summary, e.description) if part)
+        if not text:
+            return ''
+        # Экранируется каждая кавычка: текст LLM может начинаться или заканчиваться на ",
+        # и тогда """...""" закрылся бы раньше времени
+        text = text.replace('\\', '\\\\').replace('"', '\\"')
+        return textwrap.indent(f'"""{text}"""', '    ') + '\n'
 
-    def create_client(self, endpoints: list[EndPoint]):
+    def _render_methods(self, endpoints: list[EndPoint], template: str) -> list:
         methods = []
         for e in endpoints:
             path = self.format_path(e.path)
+            declared = {p.get("name"): p.get("type") for p in e.params}
+            path_params = list(dict.fromkeys(re.findall(r'{([a-zA-Z0-9_]+)}', path)))
+            extra = [name for name in declared if name not in path_params]
+
+            # Параметры пути обязательны, остальные уходят в query (GET) или JSON-тело и могут быть опущены
+            params = ''
+            for name in path_params + extra:
+                annotation = f': {declared[name]}' if declared.get(name) in CLIENT_TYPES else ''
+                default = '' if name in path_params else (' = None' if annotation else '=None')
+                params += f', {name}{annotation}{default}'
+            payload = f', {{{", ".join(f"{name!r}: {name}" for name in extra)}}}' if extra else ''
+
             for method in e.methods:
-                params = ''.join([f', {param.get("name")}: {param.get("type")}' for param in e.params])
-                method_name = e.function
-                summary = e.summary
-                description = e.description
-                code = METHOD_TEMPLATE.format(
+                # Один обработчик на несколько HTTP-методов даёт отдельный метод клиента на каждый
+                method_name = e.function if len(e.methods) == 1 else f'{e.function}_{method.lower()}'
+                methods.append(template.format(
                     method_name=method_name,
                     path=path,
                     params=params,
                     method=method,
-                    description=description,
-                    summary=summary)
-                methods.append(code)
+                    payload=payload,
+                    docstring=self._docstring(e)))
+        return methods
 
-        methods_block = textwrap.indent(''.join(methods), '    ')
+    def create_client(self, endpoints: list[EndPoint]):
+        methods_block = textwrap.indent(''.join(self._render_methods(endpoints, METHOD_TEMPLATE)), '    ')
         return CLIENT_BASE.format(methods=methods_block)
+
+    def create_async_client(self, endpoints: list[EndPoint]):
+        methods_block = textwrap.indent(''.join(self._render_methods(endpoints, ASYNC_METHOD_TEMPLATE)), '    ')
+        return ASYNC_CLIENT_BASE.format(methods=methods_block)
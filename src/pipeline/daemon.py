@@ -0,0 +1,165 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import List
+
+from metrics import metrics
+from parser import parse_files
+from pipeline.utils import serialize_endpoints
+from pipeline.watcher import create_watcher, wait_for_changes
+
+COMMANDS = ("run", "status", "stop")
+
+
+def _endpoint_key(endpoint) -> str:
+    # Эндпоинт считается неизменённым, если совпадает всё, что уходит в промпт
+    return serialize_endpoints([asdict(endpoint)])
+
+
+class ControlServer(socketserver.ThreadingTCPServer):
+    # Настройки задаются в подклассе, а не на stdlib-классе, чтобы не менять его для всего процесса
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class WatchDaemon:
+    # Процесс держит загруженными GenerationService (и модель) и последнее состояние проекта.
+    # По изменениям в дереве заново проходят parse -> document -> build только затронутые файлы,
+    # а документация неизменённых эндпоинтов берётся из памяти без обращения к LLM
+    def __init__(self, orchestrator, base_dir: str, patterns: List[str], output_dir: str,
+                 debounce: float = 0.5, poll_interval: float = 1.0):
+        self.orchestrator = orchestrator
+        self.base_dir = os.path.abspath(base_dir)
+        self.patterns = patterns
+        self.output_dir = output_dir
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self.files = {}
+        self.docs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.status = {"state": "starting", "runs": 0, "files": 0, "endpoints": 0,
+                       "last_run": None, "last_duration": None, "last_files": [], "last_error": None}
+
+    def _collect(self) -> set:
+        return {os.path.abspath(p) for p in self.orchestrator.collector.collect(Path(self.base_dir), self.patterns)}
+
+    def _document(self, file_dir: str, file_name: str, endpoints: list) -> list:
+        known = self.docs.get(file_dir, {})
+        keys = [_endpoint_key(e) for e in endpoints]
+        fresh = []
+        for endpoint, key in zip(endpoints, keys):
+            if key in known:
+                endpoint.summary, endpoint.description = known[key]
+            else:
+                fresh.append(endpoint)
+        metrics.inc("watch_endpoints_reused", len(endpoints) - len(fresh))
+        if fresh:
+            self.orchestrator.document_stage([(file_name, fresh)])
+        self.docs[file_dir] = {key: (e.summary, e.description) for key, e in zip(keys, endpoints)}
+        return endpoints
+
+    def update(self, changed: set | None = None):
+        # changed=None - полная проверка всех файлов проекта
+        with self._lock:
+            self.status["state"] = "running"
+            start = time.perf_counter()
+            try:
+                current = self._collect()
+                removed = set(self.files) - current
+                affected = sorted(current if changed is None else current & {os.path.abspath(p) for p in changed})
+                for file_dir in removed:
+                    self.files.pop(file_dir, None)
+                    self.docs.pop(file_dir, None)
+
+                parsed = {}
+                for file_dir in affected:
+                    notation = parse_files([file_dir], base_dir=self.base_dir,
+                                           fingerprints=self.orchestrator.fingerprints)
+                    parsed[file_dir] = notation[0] if notation else None
+
+                rag_index = self.orchestrator.rag_index
+                # Правка вспомогательного модуля без маршрутов тоже обновляет индекс RAG
+                if rag_index and (affected or changed):
+                    rag_index.update(sorted(self.orchestrator.rag_files(self.base_dir, self.patterns, current)))
+                    rag_index.attach([item for item in parsed.values() if item])
+
+                for file_dir, item in parsed.items():
+                    if item is None:
+                        self.files.pop(file_dir, None)
+                        self.docs.pop(file_dir, None)
+                        continue
+                    file_name, endpoints = item
+                    endpoints = self._document(file_dir, file_name, endpoints)
+                    self.orchestrator.build_stage([(file_name, endpoints)], self.output_dir)
+                    self.files[file_dir] = (file_name, endpoints)
+
+                elapsed = time.perf_counter() - start
+                metrics.inc("watch_runs")
+                metrics.observe("watch_update_seconds", elapsed)
+                self.status.update(runs=self.status["runs"] + 1, last_run=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                   last_duration=round(elapsed, 3), last_error=None,
+                                   last_files=[os.path.relpath(p, self.base_dir) for p in affected],
+                                   files=len(self.files),
+                                   endpoints=sum(len(endpoints) for _, endpoints in self.files.values()))
+                if affected or removed:
+                    print(f"Обновлено файлов: {len(affected)}, удалено: {len(removed)} за {elapsed:.2f} с")
+            except Exception as e:
+                self.status["last_error"] = f"{type(e).__name__}: {e}"
+                print(f"Ошибка обновления: {e}")
+            finally:
+                self.status["state"] = "idle"
+
+    def handle(self, command: str) -> dict:
+        if command == "run":
+            self.update()
+        elif command == "stop":
+            self._stop.set()
+        elif command != "status":
+            return {"error": f"unknown command: {command}"}
+        return dict(self.status)
+
+    def _serve(self, port: int):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                command = self.rfile.readline().decode("utf-8").strip()
+                response = daemon.handle(command)
+                self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        server = ControlServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def serve_forever(self, port: int):
+        server = self._serve(port)
+        print(f"Управление: 127.0.0.1:{server.server_address[1]} (команды {', '.join(COMMANDS)})")
+        # Наблюдение включается до первого прохода, чтобы не потерять правки, сделанные во время него
+        watcher = create_watcher(self.base_dir, self.patterns, self.poll_interval)
+        self.update()
+        print(f"Отслеживание изменений в {self.base_dir}")
+        try:
+            while not self._stop.is_set():
+                changed = wait_for_changes(watcher, self.debounce, self._stop)
+                if changed is None or changed:
+                    self.update(changed)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            server.shutdown()
+            server.server_close()
+
+
+def send_command(command: str, port: int, timeout: float = 600) -> dict:
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+        sock.sendall((command + "\n").encode("utf-8"))
+        with sock.makefile("r", encoding="utf-8") as f:
+            return json.loads(f.readline())
@@ -0,0 +1,61 @@
+import re
+from typing import Dict, List, Tuple
+
+from models import EndPoint
+
+
+def deduplicate(notations: List[Tuple[str, List[EndPoint]]]):
+    # Группирует эндпоинты с одинаковым структурным отпечатком; в LLM уходит
+    # только первый эндпоинт каждой группы
+    groups = {}
+    for file_name, methods in notations:
+        for method in methods:
+            key = method.fingerprint or id(method)
+            groups.setdefault(key, []).append((file_name, method))
+
+    representatives = {}
+    for members in groups.values():
+        file_name, representative = members[0]
+        representatives.setdefault(file_name, []).append(representative)
+
+    rep_notations = [(file_name, representatives[file_name]) for file_name, _ in notations
+                     if file_name in representatives]
+    duplicate_groups = [members for members in groups.values() if len(members) > 1]
+    return rep_notations, duplicate_groups
+
+
+def _method_key(method: EndPoint) -> str:
+    return f"{method.methods[0]} {method.path}"
+
+
+# Символы, которые могут продолжать путь URL; точка считается продолжением, только если за ней идёт буква,
+# чтобы путь в конце предложения тоже заменялся
+_PATH_BEFORE = r"(?<![\w\-./~%{}<>])"
+_PATH_AFTER = r"(?![\w\-/~%{}<>]|\.\w)"
+
+
+def _substitute(text: str, representative: EndPoint, member: EndPoint) -> str:
+    # Заменяются только целые токены: путь, за которым не идёт продолжение пути, и имя функции
+    # как отдельное слово. Один проход, чтобы подставленный путь не попал под замену имени
+    pattern = re.compile(f"(?P<path>{_PATH_BEFORE}{re.escape(representative.path)}{_PATH_AFTER})"
+                         f"|(?P<name>\\b{re.escape(representative.function)}\\b)")
+    return pattern.sub(lambda m: member.path if m.group("path") else member.function, text)
+
+
+def fan_out(documentation: Dict[str, List[dict]], duplicate_groups: list):
+    # Документация представителя копируется остальным членам группы с подстановкой пути и имени
+    for members in duplicate_groups:
+        rep_file, representative = members[0]
+        rep_key = _method_key(representative)
+        doc = next((d for d in documentation.get(rep_file, [])
+                    if " ".join(str(d.get("method", "")).split()) == rep_key), None)
+        if doc is None:
+            continue
+
+        for file_name, member in members[1:]:
+            documentation.setdefault(file_name, []).append({
+                "method": _method_key(member),
+                "summary": _substitute(doc.get("summary", ""), representative, member),
+                "description": _substitute(doc.get("description", ""), representative, member),
+            })
+    return documentation
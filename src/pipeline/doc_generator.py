@@ -1,12 +1,25 @@
 import json
 import re
-from pipeline.utils import batch_convert_to_dicts
+from concurrent.futures import ThreadPoolExecutor
+from metrics import TOKEN_BUCKETS, metrics
+from pipeline.dedup import deduplicate, fan_out
+from pipeline.doc_policy import POLICIES, needs_llm
+from pipeline.ir_store import chunk_key
+from pipeline.utils import pack_by_token_budget
 
 
 class DocGenerator:
-    def __init__(self, generation_service, max_batch: int = 2):
+    def __init__(self, generation_service, max_batch: int | None = None, max_concurrency: int = 4,
+                 policy: str = "always", dedupe: bool = False, retries: int = 1, checkpoint_group: int = 16):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown documentation policy: {policy}")
         self.gen = generation_service
         self.max_batch = max_batch
+        self.max_concurrency = max_concurrency
+        self.policy = policy
+        self.dedupe = dedupe
+        self.retries = retries
+        self.checkpoint_group = checkpoint_group
 
     def _parse_llm_response(self, response: str):
         result = re.search(r"<json>(.*?)</json>", response, flags=re.DOTALL | re.IGNORECASE)
@@ -23,17 +36,185 @@ class DocGenerator:
             except:
                 return None
 
-    def get_documentation(self, notations: list, max_concurrency: int = 2):
-        result = {}
+    def _salvage_objects(self, raw: str) -> list:
+        # Из обрезанного или испорченного ответа достаются отдельные корректные объекты
+        docs = []
+        for match in re.finditer(r"\{[^{}]*\}", raw):
+            try:
+                item = json.loads(match.group(0))
+            except json.JSONDecodeError:
+                continue
+            if isinstance(item, dict) and isinstance(item.get("method"), str):
+                docs.append(item)
+        return docs
+
+    def _extract_docs(self, raw: str | None) -> list:
+        if not raw:
+            return []
+        json_part = self._parse_llm_response(raw)
+        parsed = self._safe_json_loads(json_part) if json_part else None
+        if isinstance(parsed, list) and parsed:
+            return parsed
+        return self._salvage_objects(raw)
+
+    def _parse_docs(self, raw: str | None) -> list:
+        docs = self._extract_docs(raw)
+        if not docs:
+            metrics.inc("llm_response_parse_failures")
+        return docs
+
+    def _is_usable(self, raw: str) -> bool:
+        return bool(self._extract_docs(raw))
+
+    def _document_chunk(self, chunk: list) -> list:
+        # Сбой одного запроса не прерывает весь запуск: эндпоинты чанка уйдут на повтор как недокументированные
+        try:
+            raw = self.gen.generate(chunk, accept=self._is_usable)
+        except Exception as e:
+            metrics.inc("llm_request_failures")
+            print(f"Ошибка генерации документации: {type(e).__name__}: {e}")
+            raw = None
+        return self._parse_docs(raw)
+
+    def _generate_chunks(self, chunks: list, max_concurrency: int, on_done=None) -> list:
+        if self.gen.supports_batching():
+            # Локальная модель обрабатывает чанки микро-батчами. При ведении журнала чанки
+            # отправляются группами, чтобы готовые результаты сохранялись по ходу запуска
+            group = max(1, self.checkpoint_group) if on_done else max(1, len(chunks))
+            docs = []
+            for start in range(0, len(chunks), group):
+                part = chunks[start:start + group]
+                try:
+                    raws = self.gen.generate_batch(part, accept=self._is_usable)
+                except Exception as e:
+                    # Как и в поточечном режиме: сбой группы (нехватка памяти, ошибка токенизатора)
+                    # не прерывает запуск, её эндпоинты уйдут на повтор как недокументированные
+                    metrics.inc("llm_request_failures")
+                    print(f"Ошибка генерации документации: {type(e).__name__}: {e}")
+                    raws = [None] * len(part)
+                for j, raw in enumerate(raws, start):
+                    docs.append(self._parse_docs(raw))
+                    if on_done:
+                        on_done(j, docs[-1])
+            return docs
+
+        def work(j: int) -> list:
+            parsed = self._document_chunk(chunks[j])
+            if on_done:
+                on_done(j, parsed)
+            return parsed
+
+        # Запросы выполняются параллельно, ограничение по движку задаёт GenerationService.
+        # В режиме auto потоков должно хватать на слоты обоих движков
+        workers = max(max_concurrency, self.gen.parallel_slots())
+        self.gen.expect_requests(len(chunks))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(work, range(len(chunks))))
+
+    @staticmethod
+    def _missing(chunk: list, docs: list) -> list:
+        documented = set()
+        for doc in docs:
+            if isinstance(doc, dict) and isinstance(doc.get("method"), str):
+                documented.add(" ".join(doc["method"].split()))
+        return [item for item in chunk
+                if item["methods"] and not any(f"{m} {item['path']}" in documented for m in item["methods"])]
+
+    def _report_prompt_tokens(self, chunks: list):
+        # Оценка размера промптов до отправки: видно экономию и запас до окна контекста
+        tokens = [self.gen.estimate_prompt_tokens(chunk) for chunk in chunks]
+        for count in tokens:
+            metrics.observe("prompt_tokens_estimated", count, buckets=TOKEN_BUCKETS)
+        limit = self.gen.prompt_limit()
+        over = sum(1 for count in tokens if count > limit)
+        print(f"Промптов: {len(tokens)}, входных токенов: {sum(tokens)}, "
+              f"в среднем {sum(tokens) // len(tokens)}, максимум {max(tokens)} из {limit}")
+        if over:
+            metrics.inc("prompts_over_context", over)
+            print(f"Промптов больше окна контекста: {over}")
+
+    def _report_skipped(self, skipped: list, avoided: int):
+        if not skipped:
+            return
+        metrics.inc("endpoints_documented_without_llm", len(skipped))
+        metrics.inc("llm_calls_avoided", avoided)
+        print(f"Эндпоинтов с готовой документацией: {len(skipped)}, вызовов LLM сэкономлено: {avoided}")
+
+    def get_documentation(self, notations: list, max_concurrency: int | None = None, checkpoint=None):
+        max_concurrency = max_concurrency or self.max_concurrency
+        result = {file_name: [] for file_name, _ in notations}
 
+        pending = []
+        skipped = []
         for file_name, methods in notations:
-            result[file_name] = []
-            chunks = batch_convert_to_dicts(methods, max_concurrency)
-            for chunk in chunks:
-                raw = self.gen.generate(chunk)
-                json_part = self._parse_llm_response(raw)
-                parsed = self._safe_json_loads(json_part) if json_part else None
-                if parsed and isinstance(parsed, list):
-                    result[file_name].extend(parsed)
-
-        return result
\ No newline at end of file
+            selected = [m for m in methods if needs_llm(m, self.policy)]
+            skipped.extend(m for m in methods if not needs_llm(m, self.policy))
+            if selected:
+                pending.append((file_name, selected))
+
+        if not pending:
+            self._report_skipped(skipped, 0)
+            return result
+
+        duplicate_groups = []
+        if self.dedupe:
+            pending, duplicate_groups = deduplicate(pending)
+            duplicates = sum(len(members) - 1 for members in duplicate_groups)
+            metrics.inc("duplicate_groups", len(duplicate_groups))
+            metrics.inc("endpoints_deduplicated", duplicates)
+            if duplicate_groups:
+                print(f"Групп одинаковых эндпоинтов: {len(duplicate_groups)}, эндпоинтов без отдельной генерации: {duplicates}")
+
+        budget = self.gen.prompt_budget()
+        max_items = self.gen.max_endpoints_per_prompt()
+        if self.max_batch:
+            max_items = min(max_items, self.max_batch)
+
+        tasks = []
+        for file_name, methods in pending:
+            for chunk in pack_by_token_budget(methods, self.gen.count_tokens, budget, max_items):
+                tasks.append((file_name, chunk))
+
+        # Оценка сэкономленных вызовов: сколько промптов понадобилось бы пропущенным эндпоинтам
+        avoided = len(pack_by_token_budget(skipped, self.gen.count_tokens, budget, max_items)) if skipped else 0
+        self._report_skipped(skipped, avoided)
+
+        chunks = [chunk for _, chunk in tasks]
+        docs = [None] * len(chunks)
+        keys = [chunk_key(self.gen.serialize_input(chunk)) for chunk in chunks] if checkpoint else []
+        for i, key in enumerate(keys):
+            stored = checkpoint.get(key)
+            if stored is not None:
+                docs[i] = list(stored)
+        todo = [i for i, parsed in enumerate(docs) if parsed is None]
+        if len(todo) < len(chunks):
+            metrics.inc("chunks_resumed", len(chunks) - len(todo))
+            print(f"Чанков из журнала предыдущего запуска: {len(chunks) - len(todo)} из {len(chunks)}")
+
+        def checkpointer(indices: list):
+            if not checkpoint:
+                return None
+            return lambda j, parsed: checkpoint.add(keys[indices[j]], parsed)
+
+        if todo:
+            self._report_prompt_tokens([chunks[i] for i in todo])
+            generated = self._generate_chunks([chunks[i] for i in todo], max_concurrency, checkpointer(todo))
+            for i, parsed in zip(todo, generated):
+                docs[i] = parsed
+
+        # Повторно запрашиваются только эндпоинты, которых нет в разобранном ответе
+        for _ in range(self.retries):
+            retry = [(i, missing) for i, chunk in enumerate(chunks) if (missing := self._missing(chunk, docs[i]))]
+            if not retry:
+                break
+            metrics.inc("endpoints_retried", sum(len(missing) for _, missing in retry))
+            print(f"Повторный запрос документации для {sum(len(m) for _, m in retry)} эндпоинтов")
+            indices = [i for i, _ in retry]
+            extras = self._generate_chunks([m for _, m in retry], max_concurrency, checkpointer(indices))
+            for i, extra in zip(indices, extras):
+                docs[i] = docs[i] + extra
+
+        for (file_name, _), parsed in zip(tasks, docs):
+            result[file_name].extend(parsed)
+
+        return fan_out(result, duplicate_groups)
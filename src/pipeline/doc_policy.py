@@ -0,0 +1,33 @@
+from models import EndPoint
+
+# always       - все эндпоинты отправляются в LLM, её ответ заменяет docstring
+# missing-only - в LLM отправляются только эндпоинты совсем без документации
+# augment      - в LLM отправляются недокументированные и частично документированные,
+#                ответ LLM заполняет только пустые поля
+POLICIES = ("always", "missing-only", "augment")
+
+COMPLETE = "complete"
+PARTIAL = "partial"
+MISSING = "missing"
+
+
+def doc_completeness(endpoint: EndPoint) -> str:
+    # Учитываются только поля, которые LLM может заполнить: типы параметров ответ не содержит,
+    # поэтому эндпоинт с summary и описанием, но без аннотаций, отправлять в LLM бесполезно
+    has_summary = bool(endpoint.summary and endpoint.summary.strip())
+    has_description = bool(endpoint.description and endpoint.description.strip())
+
+    if has_summary and has_description:
+        return COMPLETE
+    if not has_summary and not has_description:
+        return MISSING
+    return PARTIAL
+
+
+def needs_llm(endpoint: EndPoint, policy: str) -> bool:
+    if policy == "always":
+        return True
+    completeness = doc_completeness(endpoint)
+    if policy == "missing-only":
+        return completeness == MISSING
+    return completeness != COMPLETE
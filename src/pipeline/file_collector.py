@@ -1,18 +1,159 @@
-from typing import List
+from typing import Iterator, List
 import fnmatch
 import os
+import re
+
+DEFAULT_EXCLUDE_DIRS = frozenset({
+    ".git", ".hg", ".svn", ".idea", ".vscode", "__pycache__", "node_modules",
+    ".venv", "venv", "env", ".env", ".tox", ".nox", ".mypy_cache", ".pytest_cache", ".ruff_cache",
+    ".cache", "build", "dist", "site-packages", ".eggs",
+})
+
+ROUTE_MARKERS = (b"route",)
+
+
+def _translate_gitignore(pattern: str) -> str:
+    res = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            res.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            res.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            res.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            res.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            j = pattern.index("]", i + 1)
+            body = pattern[i + 1:j]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            res.append(f"[{body}]")
+            i = j + 1
+        else:
+            res.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(res)
+
+
+class IgnoreRules:
+    def __init__(self):
+        # (base, regex, negate, dir_only, anchored); base - каталог .gitignore относительно корня
+        self.rules = []
+
+    def add(self, pattern: str, base: str = ""):
+        pattern = pattern.rstrip("\n").rstrip()
+        if not pattern or pattern.startswith("#"):
+            return
+        negate = pattern.startswith("!")
+        if negate:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.strip("/") if dir_only else pattern
+        anchored = "/" in pattern
+        regex = re.compile(_translate_gitignore(pattern.lstrip("/")))
+        self.rules.append((base, regex, negate, dir_only, anchored))
+
+    def load(self, gitignore_path: str, base: str = ""):
+        try:
+            with open(gitignore_path, "r", encoding="utf-8", errors="ignore") as f:
+                for line in f:
+                    self.add(line, base)
+        except OSError:
+            pass
+
+    def ignored(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        result = False
+        for base, regex, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel_path.startswith(base + "/"):
+                    continue
+                target = rel_path[len(base) + 1:]
+            else:
+                target = rel_path
+            if regex.fullmatch(target if anchored else name):
+                result = not negate
+        return result
+
+
 class FileCollector:
-    def collect(self, base_directory: str, patterns: List[str]) -> List[str]:
+    def __init__(self, exclude: List[str] | None = None, use_gitignore: bool = True,
+                 prescan: bool = False, exclude_dirs=DEFAULT_EXCLUDE_DIRS):
+        self.exclude = exclude or []
+        self.use_gitignore = use_gitignore
+        self.prescan = prescan
+        self.exclude_dirs = exclude_dirs
+        self.scanned = 0
+        self.skipped = 0
+        self.pruned_dirs = 0
+
+    def collect(self, base_directory: str, patterns: List[str], prescan: bool | None = None) -> List[str]:
+        return list(self.iter_collect(base_directory, patterns, prescan))
+
+    def _compile_patterns(self, patterns: List[str]):
+        flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+        return re.compile("|".join(fnmatch.translate(p) for p in patterns), flags)
+
+    def _has_route(self, file_path: str) -> bool:
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        return any(marker in data for marker in ROUTE_MARKERS)
+
+    def iter_collect(self, base_directory: str, patterns: List[str], prescan: bool | None = None) -> Iterator[str]:
+        # prescan=None - по настройке коллектора; индексу RAG нужны и файлы без маршрутов
         if not os.path.isdir(base_directory):
             raise FileNotFoundError
+        prescan = self.prescan if prescan is None else prescan
 
-        result = []
+        self.scanned = self.skipped = self.pruned_dirs = 0
+        matcher = self._compile_patterns(patterns)
+        rules = IgnoreRules()
+        for pattern in self.exclude:
+            rules.add(pattern)
 
-        for root, dirs, files in os.walk(base_directory):
-            for fname in files:
-                for pattern in patterns:
-                    if fnmatch.fnmatch(fname, pattern):
-                        file_path = os.path.join(root, fname)
-                        if os.path.isfile(file_path):
-                            result.append(file_path)
-        return result
+        # Обход в глубину через os.scandir: исключённые каталоги отсекаются до спуска в них
+        stack = [(str(base_directory), "")]
+        while stack:
+            directory, rel_dir = stack.pop()
+            if self.use_gitignore:
+                rules.load(os.path.join(directory, ".gitignore"), rel_dir)
+
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                print(f"Не удалось прочитать каталог {directory}: {e}")
+                continue
+
+            subdirs = []
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in self.exclude_dirs or rules.ignored(rel_path, entry.name, True):
+                        self.pruned_dirs += 1
+                        continue
+                    subdirs.append((entry.path, rel_path))
+                    continue
+
+                if not matcher.match(entry.name) or not entry.is_file():
+                    continue
+                self.scanned += 1
+                if rules.ignored(rel_path, entry.name, False) or (prescan and not self._has_route(entry.path)):
+                    self.skipped += 1
+                    continue
+                yield entry.path
+
+            stack.extend(reversed(subdirs))
+
+        print(f"Просмотрено файлов: {self.scanned}, пропущено: {self.skipped}, "
+              f"исключено каталогов: {self.pruned_dirs}")
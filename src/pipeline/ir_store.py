@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from dataclasses import astuple, fields
+from typing import Iterator, List, Tuple
+
+from models import EndPoint
+
+IR_SCHEMA = "apigen-ir"
+IR_VERSION = 1
+IR_FIELDS = [f.name for f in fields(EndPoint)]
+
+
+def write_ir(path: str, notation: List[Tuple[str, List[EndPoint]]], stage: str = "parse"):
+    # Заголовок с версией схемы, затем по строке на эндпоинт: [файл, значения полей в порядке IR_FIELDS]
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        header = {"schema": IR_SCHEMA, "version": IR_VERSION, "stage": stage, "fields": IR_FIELDS}
+        f.write(json.dumps(header) + "\n")
+        for file_name, methods in notation:
+            for method in methods:
+                f.write(json.dumps([file_name, *astuple(method)], ensure_ascii=False, separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+
+
+def iter_ir(path: str) -> Iterator[Tuple[str, List[EndPoint]]]:
+    with open(path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("schema") != IR_SCHEMA or header.get("version") != IR_VERSION:
+            raise ValueError(f"Unsupported IR file: {path}")
+        if header.get("fields") != IR_FIELDS:
+            raise ValueError(f"IR fields do not match EndPoint: {path}")
+
+        current, methods = None, []
+        for line in f:
+            if not line.strip():
+                continue
+            file_name, *values = json.loads(line)
+            if file_name != current and methods:
+                yield current, methods
+                methods = []
+            current = file_name
+            methods.append(EndPoint(*values))
+        if methods:
+            yield current, methods
+
+
+def load_ir(path: str) -> List[Tuple[str, List[EndPoint]]]:
+    return list(iter_ir(path))
+
+
+def chunk_key(payload: str) -> str:
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class DocCheckpoint:
+    # Журнал готовых чанков стадии document: по строке на чанк, ключ - хэш сериализованного чанка.
+    # Прерванный запуск при повторе берёт документацию из журнала и генерирует только остальное
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.docs = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Последняя строка могла оборваться при аварийном завершении
+                        continue
+                    self.docs.setdefault(record["key"], []).extend(record["docs"])
+        except OSError:
+            pass
+
+    def get(self, key: str) -> list | None:
+        return self.docs.get(key)
+
+    def add(self, key: str, docs: list):
+        line = json.dumps({"key": key, "docs": docs}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.docs.setdefault(key, []).extend(docs)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,75 +1,144 @@
+import json
 import os
+import tempfile
+import textwrap
 import yaml
-from typing import List, Tuple
+from typing import Iterable, List, Tuple
+from metrics import metrics
 from models import EndPoint
-from pipeline.utils import to_openapi_type
+from pipeline.utils import AtomicWriter, to_openapi_type, write_if_changed
+
+# libyaml в несколько раз быстрее чистого Python; без него используется обычный SafeDumper
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+def _dump(data, stream=None):
+    return yaml.dump(data, stream, Dumper=YAML_DUMPER, allow_unicode=True,
+                     default_flow_style=False, sort_keys=False)
+
 
 class OpenApiBuilder:
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, merged: bool = False, merged_name: str = "openapi.yaml"):
         self.output_dir = output_dir
+        self.merged = merged
+        self.merged_name = merged_name
+        self.written = 0
+        self.unchanged = 0
 
-    def build(self, enriched_ir: List[Tuple[str, List[EndPoint]]], title: str = "API",
+    def build(self, enriched_ir: Iterable[Tuple[str, List[EndPoint]]], title: str = "API",
                            version: str = "1.0.0") -> None:
-        os.makedirs(self.output_dir, exist_ok=True)
-
+        self.written = self.unchanged = 0
+        if self.merged:
+            self.build_merged(enriched_ir, title, version)
+            return
         for file_name, methods in enriched_ir:
-            openapi = {
-                "openapi": "3.0.0",
-                "info": {
-                    "title": f"{title} - {os.path.basename(file_name)}",
-                    "version": version
-                },
-                "paths": {}
-            }
+            self.build_file(file_name, methods, title, version)
+        if self.unchanged:
+            print(f"OpenAPI файлов без изменений: {self.unchanged}, перезаписано: {self.written}")
+
+    def _paths(self, file_name: str, methods: List[EndPoint]) -> dict:
+        paths = {}
+        for m in methods:
+            path = m.path or f"/{os.path.basename(file_name)}/{m.function}"
+            http_method = (m.methods[0] or "get").lower()
+
+            summary = m.summary or ""
+            description = m.description or ""
 
-            for m in methods:
-                path = m.path or f"/{os.path.basename(file_name)}/{m.function}"
-                http_method = (m.methods[0] or "get").lower()
-
-                summary = m.summary or ""
-                description = m.description or ""
-
-                parameters = []
-                for p in m.params:
-                    parameters.append({
-                        "name": p.get("name"),
-                        "in": p.get("in", "query"),
-                        "required": bool(p.get("required", False)),
-                        "schema": {"type": to_openapi_type(p.get("type", "string"))},
-                        "description": p.get("description", "")
-                    })
-
-                responses = {
-                    "200": {
-                        "description": "Successful Response",
-                        "content": {
-                            "application/json": {
-                                "schema": {"type": "object"}
-                            }
+            parameters = []
+            for p in m.params:
+                parameters.append({
+                    "name": p.get("name"),
+                    "in": p.get("in", "query"),
+                    "required": bool(p.get("required", False)),
+                    "schema": {"type": to_openapi_type(p.get("type") or "string")},
+                    "description": p.get("description", "")
+                })
+
+            responses = {
+                "200": {
+                    "description": "Successful Response",
+                    "content": {
+                        "application/json": {
+                            "schema": {"type": "object"}
                         }
                     }
                 }
+            }
 
-                if path not in openapi["paths"]:
-                    openapi["paths"][path] = {}
+            if path not in paths:
+                paths[path] = {}
 
-                openapi["paths"][path][http_method] = {
-                    "summary": summary,
-                    "description": description,
-                    "parameters": parameters,
-                    "responses": responses,
-                }
+            paths[path][http_method] = {
+                "summary": summary,
+                "description": description,
+                "parameters": parameters,
+                "responses": responses,
+            }
+        return paths
 
-            base_name = os.path.basename(file_name)
-            name_without_ext = os.path.splitext(base_name)[0]
-            output_file = os.path.join(self.output_dir, f"{name_without_ext}.yaml")
-            self._safe_write(output_file, openapi)
+    def build_file(self, file_name: str, methods: List[EndPoint], title: str = "API",
+                   version: str = "1.0.0") -> None:
+        openapi = {
+            "openapi": "3.0.0",
+            "info": {
+                "title": f"{title} - {file_name}",
+                "version": version
+            },
+            "paths": self._paths(file_name, methods)
+        }
 
-    def _safe_write(self, output_file, openapi):
+        # Спецификация повторяет относительный путь исходного файла: a/views.py -> a/views.yaml
+        output_file = os.path.join(self.output_dir, f"{os.path.splitext(file_name)[0]}.yaml")
+        self._safe_write(output_file, openapi)
+
+    def build_merged(self, enriched_ir: Iterable[Tuple[str, List[EndPoint]]], title: str = "API",
+                     version: str = "1.0.0") -> None:
+        # Операции одного пути могут прийти из разных файлов (GET /items в a.py, POST /items в b.py),
+        # поэтому каждая операция сначала сбрасывается во временный файл. В памяти остаются только
+        # HTTP-методы и смещения операций каждого пути, а не словарь спецификации всего проекта
+        output_file = os.path.join(self.output_dir, self.merged_name)
+        owners = {}
+        offsets = {}
         try:
-            with open(output_file, "w", encoding="utf-8") as f:
-                yaml.dump(openapi, f, allow_unicode=True, encoding="utf-8",
-                          default_flow_style=False, sort_keys=False)
+            with tempfile.TemporaryFile() as spill:
+                for file_name, methods in enriched_ir:
+                    for path, operations in self._paths(file_name, methods).items():
+                        for verb, operation in operations.items():
+                            owner = owners.get((path, verb))
+                            if owner is not None:
+                                metrics.inc("merged_spec_duplicate_operations")
+                                print(f"Операция {verb.upper()} {path} из {file_name} уже описана в {owner}, пропущена")
+                                continue
+                            owners[(path, verb)] = file_name
+                            data = json.dumps(operation, ensure_ascii=False).encode("utf-8")
+                            offsets.setdefault(path, []).append((verb, spill.tell(), len(data)))
+                            spill.write(data)
+
+                with AtomicWriter(output_file) as out:
+                    _dump({"openapi": "3.0.0", "info": {"title": title, "version": version}}, out)
+                    out.write("paths:\n" if offsets else "paths: {}\n")
+                    for path, entries in offsets.items():
+                        operations = {}
+                        for verb, offset, length in entries:
+                            spill.seek(offset)
+                            operations[verb] = json.loads(spill.read(length))
+                        out.write(textwrap.indent(_dump({path: operations}), "  "))
+            self._report(output_file, out.changed)
+        except Exception as e:
+            print(f"Error writing YAML file {output_file}: {e}")
+
+    def _report(self, output_file: str, changed: bool):
+        if changed:
+            self.written += 1
+            metrics.inc("outputs_written", labels={"kind": "openapi"})
             print(f"Создали OpenAPI файл спецификации: {output_file}")
+        else:
+            self.unchanged += 1
+            metrics.inc("outputs_unchanged", labels={"kind": "openapi"})
+
+    def _safe_write(self, output_file, openapi):
+        try:
+            self._report(output_file, write_if_changed(output_file, _dump(openapi)))
         except Exception as e:
-            print(f"Error writing YAML file {output_file}: {e}")
\ No newline at end of file
+            print(f"Error writing YAML file {output_file}: {e}")
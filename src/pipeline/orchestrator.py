@@ -1,28 +1,142 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple
+from metrics import metrics
 from models import EndPoint
 from pathlib import Path
-from parser import parse_files
+from parser import parse_files, iter_parse_files
+
+_DONE = object()
 
 class Orchestrator:
-    def __init__(self, collector , doc_gen, openapi_builder, client_generator):
+    def __init__(self, collector , doc_gen, openapi_builder, client_generator, parse_cache=None,
+                 parse_jobs: int = 1, rag_index=None):
         self.collector = collector
         self.doc_gen = doc_gen
         self.openapi_builder = openapi_builder
         self.client_generator = client_generator
+        self.parse_cache = parse_cache
+        self.parse_jobs = parse_jobs
+        self.rag_index = rag_index
+
+    @property
+    def fingerprints(self) -> bool:
+        # Структурные отпечатки считаются при разборе, только если их использует дедупликация
+        return bool(getattr(self.doc_gen, "dedupe", False))
+
+    def parse_stage(self, base_dir: str, patterns: List[str]) -> List[Tuple[str, List[EndPoint]]]:
+        with metrics.span("collect"):
+            files = self.collector.collect(Path(base_dir), patterns)
+        with metrics.span("parse"):
+            notation = parse_files([str(p) for p in files], cache=self.parse_cache, jobs=self.parse_jobs,
+                                   base_dir=base_dir, fingerprints=self.fingerprints)
+        if self.rag_index:
+            # Контекст сохраняется в эндпоинтах, поэтому стадия document не нуждается в исходниках
+            with metrics.span("rag"):
+                self.rag_index.update([str(p) for p in self.rag_files(base_dir, patterns, files)])
+                self.rag_index.attach(notation)
+        metrics.inc("files_total", len(notation))
+        metrics.inc("endpoints_total", sum(len(methods) for _, methods in notation))
+        return notation
+
+    def rag_files(self, base_dir: str, patterns: List[str], files: list) -> list:
+        # С --prescan в разбор не попадают модули без маршрутов, но их функции нужны индексу RAG
+        if not getattr(self.collector, "prescan", False):
+            return files
+        return self.collector.collect(Path(base_dir), patterns, prescan=False)
+
+    def document_stage(self, notation: List[Tuple[str, List[EndPoint]]], checkpoint=None):
+        with metrics.span("document"):
+            documentation = self.doc_gen.get_documentation(notation, checkpoint=checkpoint)
+        with metrics.span("merge"):
+            return self._merge_docs(notation, documentation)
+
+    def build_stage(self, enriched: List[Tuple[str, List[EndPoint]]], output_dir: str):
+        with metrics.span("openapi"):
+            self.openapi_builder.build(enriched)
+        with metrics.span("clients"):
+            self.client_generator.create_clients(enriched, Path(output_dir))
 
     def run(self, base_dir: str, patterns: List[str], output_dir: str):
-        files = self.collector.collect(Path(base_dir), patterns)
-        notation = parse_files([str(p) for p in files])
-        documentation = self.doc_gen.get_documentation(notation)
-        enriched = self._merge_docs(notation, documentation)
-        self.openapi_builder.build(enriched)
-        self.client_generator.create_clients(enriched, Path(output_dir))
+        notation = self.parse_stage(base_dir, patterns)
+        enriched = self.document_stage(notation)
+        self.build_stage(enriched, output_dir)
+
+    def run_streaming(self, base_dir: str, patterns: List[str], output_dir: str, buffer_size: int = 8):
+        # Файлы проходят collect -> parse -> document -> merge -> emit по одному:
+        # спецификация и клиент файла записываются сразу после получения его документации,
+        # а в памяти одновременно находится не больше buffer_size файлов на каждой стадии
+        parsed = queue.Queue(maxsize=buffer_size)
+        if self.rag_index:
+            # Контекст может ссылаться на любой файл проекта, поэтому индекс обновляется до начала потока
+            with metrics.span("rag"):
+                self.rag_index.update([str(p) for p in self.collector.iter_collect(Path(base_dir), patterns,
+                                                                                   prescan=False)])
+
+        def produce():
+            try:
+                files = (str(p) for p in self.collector.iter_collect(Path(base_dir), patterns))
+                for item in iter_parse_files(files, cache=self.parse_cache, jobs=self.parse_jobs,
+                                             batch_size=max(1, self.parse_jobs) * 4, base_dir=base_dir,
+                                             fingerprints=self.fingerprints):
+                    parsed.put(item)
+                parsed.put(_DONE)
+            except BaseException as e:
+                parsed.put(e)
+
+        # В потоковом режиме стадии перекрываются, поэтому их спаны суммируются по файлам
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        in_flight = threading.BoundedSemaphore(buffer_size)
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.doc_gen.max_concurrency) as pool:
+            while True:
+                item = parsed.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                in_flight.acquire()
+                future = pool.submit(self._process_file, item, Path(output_dir))
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append(future)
+
+            for future in futures:
+                future.result()
+
+        producer.join()
+
+    def _process_file(self, api_file: Tuple[str, List[EndPoint]], output_dir: Path):
+        metrics.inc("files_total")
+        metrics.inc("endpoints_total", len(api_file[1]))
+        if self.rag_index:
+            with metrics.span("rag"):
+                self.rag_index.attach([api_file])
+        with metrics.span("document"):
+            documentation = self.doc_gen.get_documentation([api_file])
+        with metrics.span("merge"):
+            file_name, endpoints = self._merge_docs([api_file], documentation)[0]
+        with metrics.span("openapi"):
+            self.openapi_builder.build_file(file_name, endpoints)
+        with metrics.span("clients"):
+            self.client_generator.create_client_file(file_name, endpoints, output_dir)
 
     def _merge_docs(self, enriched_ir: List[Tuple[str, List[EndPoint]]], documentation: Dict[str, List[dict]]):
+        # В режиме augment ответ LLM только дополняет существующий docstring
+        overwrite = getattr(self.doc_gen, "policy", "always") != "augment"
         doc_lookup = {}
         for file_name, doc_methods in documentation.items():
             for doc_method in doc_methods:
-                req, method_path = doc_method.get("method", "").split()
+                # Ответ модели может содержать method без пути или с лишними словами:
+                # такой элемент пропускается, а не обрывает весь запуск
+                method = doc_method.get("method") if isinstance(doc_method, dict) else None
+                parts = method.split(maxsplit=1) if isinstance(method, str) else []
+                if len(parts) != 2:
+                    metrics.inc("malformed_doc_methods")
+                    continue
+                req, method_path = parts
                 key = (file_name, method_path, req)
                 doc_lookup[key] = doc_method
         for file_name, ir_methods in enriched_ir:
@@ -34,6 +148,8 @@ class Orchestrator:
                     key = (file_name, method_path, req)
                     if key in doc_lookup:
                         doc_method = doc_lookup[key]
-                        ir_method.summary = doc_method.get("summary", "")
-                        ir_method.description = doc_method.get("description", "")
+                        if overwrite or not ir_method.summary:
+                            ir_method.summary = doc_method.get("summary", "")
+                        if overwrite or not ir_method.description:
+                            ir_method.description = doc_method.get("description", "")
         return enriched_ir
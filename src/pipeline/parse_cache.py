@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import asdict
+from typing import List
+
+from metrics import metrics
+from models import EndPoint
+
+CACHE_VERSION = 4
+
+
+def project_cache_path(cache_dir: str, base_dir: str) -> str:
+    # Отдельный файл на каждый проект: prune после запуска удаляет только записи этого проекта,
+    # и поочерёдные запуски на разных проектах не сбрасывают кэш друг друга
+    digest = hashlib.sha256(os.path.abspath(base_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{digest}.json")
+
+
+class ParseCache:
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        self.files = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if data.get("version") != CACHE_VERSION:
+            return {}
+        return data.get("files", {})
+
+    @staticmethod
+    def _hash_file(file_path: str) -> str:
+        with open(file_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def get(self, file_path: str, fingerprints: bool = False) -> List[EndPoint] | None:
+        key = os.path.abspath(file_path)
+        entry = self.files.get(key)
+        # Запись без отпечатков не подходит запуску с --dedupe; записи с отпечатками подходят любому
+        if entry is None or (fingerprints and not entry.get("fingerprints")):
+            self.misses += 1
+            metrics.inc("parse_cache_misses")
+            return None
+
+        st = os.stat(file_path)
+        if (st.st_mtime_ns, st.st_size) != (entry["mtime_ns"], entry["size"]):
+            # mtime мог измениться без изменения содержимого (checkout, touch)
+            if entry["hash"] != self._hash_file(file_path):
+                self.misses += 1
+                metrics.inc("parse_cache_misses")
+                return None
+            entry["mtime_ns"], entry["size"] = st.st_mtime_ns, st.st_size
+
+        self.hits += 1
+        metrics.inc("parse_cache_hits")
+        return [EndPoint(**e) for e in entry["endpoints"]]
+
+    def put(self, file_path: str, endpoints: List[EndPoint], fingerprints: bool = False):
+        st = os.stat(file_path)
+        self.files[os.path.abspath(file_path)] = {
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "hash": self._hash_file(file_path),
+            "fingerprints": fingerprints,
+            "endpoints": [asdict(e) for e in endpoints],
+        }
+
+    def prune(self, file_paths: List[str]):
+        keep = {os.path.abspath(p) for p in file_paths}
+        self.files = {k: v for k, v in self.files.items() if k in keep}
+
+    def save(self):
+        cache_dir = os.path.dirname(self.cache_path) or "."
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
@@ -1,10 +1,86 @@
+import hashlib
+import json
+import os
+import tempfile
 from dataclasses import asdict
 
+# Поля эндпоинта, которые нужны модели; остальные (fingerprint и т.п.) в промпт не попадают
+PROMPT_FIELDS = ("function", "path", "methods", "summary", "description", "params", "calls", "code_snippet", "context")
+
 
 def batch_convert_to_dicts(methods: list, chunk_size):
     chunks = [methods[i:i + chunk_size] for i in range(0, len(methods), chunk_size)]
     return [[asdict(item) for item in chunk] for chunk in chunks]
 
+def compact_endpoint(item: dict) -> dict:
+    # Пустые значения отбрасываются, параметры записываются как "name:type", вызовы без повторов
+    compact = {}
+    for field in PROMPT_FIELDS:
+        value = item.get(field)
+        if field == "params":
+            value = [f"{p['name']}:{p['type']}" if p.get("type") else p["name"] for p in value or []]
+        elif field == "calls":
+            value = list(dict.fromkeys(value or []))
+        if value:
+            compact[field] = value
+    return compact
+
+
+def serialize_endpoints(items: list) -> str:
+    # Минифицированный JSON: без пробелов после разделителей и без экранирования кириллицы
+    return json.dumps([compact_endpoint(item) for item in items], ensure_ascii=False, separators=(",", ":"))
+
+
+def _trim_context(item: dict, cost_fn, budget: int) -> dict:
+    # Контекст RAG отсортирован по важности: сначала отбрасываются последние функции
+    context = list(item.get("context") or [])
+    while context and cost_fn(item) > budget:
+        context.pop()
+        item["context"] = context
+    return item
+
+
+def _trim_snippet(item: dict, cost_fn, budget: int) -> dict:
+    lines = item["code_snippet"].split('\n')
+    while len(lines) > 1 and cost_fn(item) > budget:
+        lines = lines[:len(lines) // 2]
+        item["code_snippet"] = '\n'.join(lines)
+    if cost_fn(item) > budget:
+        item["code_snippet"] = ""
+    return item
+
+
+def pack_by_token_budget(methods: list, count_tokens, budget: int, max_items: int) -> list:
+    # Раскладка first-fit decreasing: каждый промпт укладывается в budget токенов
+    # и содержит не больше max_items эндпоинтов (ограничение по длине ответа)
+    def cost(item):
+        # Стоимость считается по тому же представлению, что попадёт в промпт, +1 токен на запятую
+        return count_tokens(serialize_endpoints([item])) + 1
+
+    items = []
+    for method in methods:
+        item = asdict(method)
+        if cost(item) > budget:
+            # Слишком большой эндпоинт: сначала убираем контекст связанных функций,
+            # затем сокращаем фрагмент кода вместо обрезки всего промпта
+            item = _trim_context(item, cost, budget)
+        if cost(item) > budget:
+            item = _trim_snippet(item, cost, budget)
+        items.append((cost(item), item))
+
+    bins = []
+    for item_cost, item in sorted(items, key=lambda x: x[0], reverse=True):
+        for b in bins:
+            if b["used"] + item_cost <= budget and len(b["items"]) < max_items:
+                b["items"].append(item)
+                b["used"] += item_cost
+                break
+        else:
+            bins.append({"used": item_cost, "items": [item]})
+
+    return [b["items"] for b in bins]
+
+
 def to_openapi_type(python_type: str) -> str:
     type_map = {
         "int": "integer",
@@ -15,4 +91,58 @@ def to_openapi_type(python_type: str) -> str:
         "dict": "object",
         "None": "null",
     }
-    return type_map.get(python_type.lower(), "string")
\ No newline at end of file
+    return type_map.get(python_type.lower(), "string")
+
+
+def _file_hash(path: str) -> str | None:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class AtomicWriter:
+    # Текст пишется во временный файл рядом с целевым; целевой файл заменяется через os.replace
+    # только если хэш содержимого изменился, поэтому неизменённые результаты сохраняют mtime
+    def __init__(self, path: str):
+        self.path = path
+        self.changed = False
+
+    def __enter__(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        self._digest = hashlib.sha256()
+        return self
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        self._file.write(data)
+        self._digest.update(data)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None and _file_hash(self.path) != self._digest.hexdigest():
+            # mkstemp создаёт файл с правами 0600, результаты должны быть доступны как обычные файлы
+            os.chmod(self._tmp_path, 0o644)
+            os.replace(self._tmp_path, self.path)
+            self.changed = True
+        else:
+            os.remove(self._tmp_path)
+        return False
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    # Текст уже в памяти: хэш сравнивается до записи, и неизменённый файл не пишется на диск вовсе.
+    # Временный файл AtomicWriter нужен только при замене
+    data = content.encode("utf-8")
+    if _file_hash(path) == hashlib.sha256(data).hexdigest():
+        return False
+    with AtomicWriter(path) as writer:
+        writer.write(content)
+    return writer.changed
@@ -0,0 +1,146 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import time
+from typing import Iterable, Set
+
+from pipeline.file_collector import DEFAULT_EXCLUDE_DIRS
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _walk_dirs(root: str, exclude_dirs) -> Iterable[str]:
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in exclude_dirs]
+        yield dirpath
+
+
+class InotifyWatcher:
+    # inotify через ctypes без сторонних зависимостей; на каждый каталог дерева ставится watch,
+    # новые каталоги добавляются по событию создания
+    def __init__(self, root: str, exclude_dirs=DEFAULT_EXCLUDE_DIRS):
+        self.exclude_dirs = exclude_dirs
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        for directory in _walk_dirs(root, exclude_dirs):
+            self._add(directory)
+
+    def _add(self, directory: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self.dirs[wd] = directory
+
+    def read(self, timeout: float) -> Set[str] | None:
+        # None - очередь событий переполнена, нужно пересканировать всё дерево
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            directory = self.dirs.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Каталог мог появиться уже с файлами: их события inotify не пришлют
+                for new_dir in _walk_dirs(path, self.exclude_dirs):
+                    self._add(new_dir)
+                    try:
+                        changed.update(os.path.join(new_dir, f) for f in os.listdir(new_dir))
+                    except OSError:
+                        continue
+            if mask & IN_DELETE_SELF:
+                self.dirs.pop(wd, None)
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # Запасной вариант для систем без inotify: сравнение mtime и размера файлов между обходами
+    def __init__(self, root: str, patterns: list, exclude_dirs=DEFAULT_EXCLUDE_DIRS, interval: float = 1.0):
+        self.root = root
+        self.patterns = patterns
+        self.exclude_dirs = exclude_dirs
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict:
+        snapshot = {}
+        for directory in _walk_dirs(self.root, self.exclude_dirs):
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_file() and any(fnmatch.fnmatch(entry.name, p) for p in self.patterns):
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+        return snapshot
+
+    def read(self, timeout: float) -> Set[str] | None:
+        time.sleep(max(timeout, self.interval))
+        snapshot = self._scan()
+        changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                   if snapshot.get(path) != self._snapshot.get(path)}
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(root: str, patterns: list, poll_interval: float = 1.0):
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError) as e:
+        # AttributeError - в libc нет inotify (не Linux)
+        print(f"inotify недоступен ({e}), используется опрос раз в {poll_interval} с")
+        return PollingWatcher(root, patterns, interval=poll_interval)
+
+
+def wait_for_changes(watcher, debounce: float, stop_event) -> Set[str] | None:
+    # События копятся, пока изменения не затихнут на debounce секунд:
+    # сохранение файла редактором даёт серию событий, а запуск нужен один
+    changed = set()
+    while not stop_event.is_set():
+        events = watcher.read(debounce if changed else 0.5)
+        if events is None:
+            return None
+        if events:
+            changed |= events
+        elif changed:
+            return changed
+    return changed
@@ -1,12 +1,26 @@
 import requests
+import math
 import os
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 import json
+from metrics import metrics
 
 load_dotenv()
 
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
 class Remote():
-    def __init__(self, repetition_penalty, max_new_tokens, temperature, top_p, num_beams, do_sample):
+    name = "remote"
+
+    def __init__(self, repetition_penalty, max_new_tokens, temperature, top_p, num_beams, do_sample,
+                 max_connections: int = 8, max_retries: int = 5, backoff: float = 1.0, timeout: float = 120,
+                 context_window: int = 32768, chars_per_token: float = 3.0, calibration_path: str | None = None):
         self.repetition_penalty = repetition_penalty
         self.max_new_tokens = max_new_tokens
         self.temperature = temperature
@@ -15,16 +29,117 @@ class Remote():
         self.do_sample = do_sample
 
         self.key = os.getenv("API_KEY")
+        self.model = "amazon/nova-2-lite-v1:free"
+        self.engine_id = f"remote:{self.model}"
+
+        self.context_window = context_window
+        # chars_per_token не меняется в течение запуска: от него зависит раскладка эндпоинтов по промптам,
+        # а значит и ключи кэша ответов. Уточнённое по ответам API значение сохраняется в calibration_path
+        # и применяется только при следующем запуске
+        self.calibration_path = calibration_path
+        self.chars_per_token = self._load_calibration() or chars_per_token
+        self.observed_chars_per_token = None
+        self._calibration_lock = threading.Lock()
+
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _retry_delay(self, response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return self.backoff * (2 ** attempt)
 
     def _send_request(self, request: dict):
-        response = requests.request(method=request["method"], url=request["url"], json=request.get('json'),
-                                    headers=request["headers"])
-        content = response.json()
-        return content
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method=request["method"], url=request["url"],
+                                                json=request.get('json'), headers=request["headers"],
+                                                timeout=self.timeout)
+            except requests.RequestException as e:
+                # Таймауты и обрывы соединения повторяются с той же задержкой, что и ответы 429/5xx
+                metrics.inc("remote_retries", labels={"status": type(e).__name__})
+                if attempt == self.max_retries:
+                    print(f'Ошибка соединения с API: {e}')
+                    return None
+                delay = self.backoff * (2 ** attempt)
+                print(f'Ошибка соединения с API ({type(e).__name__}), повтор через {delay:.1f} с')
+                time.sleep(delay)
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            delay = self._retry_delay(response, attempt)
+            metrics.inc("remote_retries", labels={"status": response.status_code})
+            print(f'Ответ {response.status_code} от API, повтор через {delay:.1f} с')
+            time.sleep(delay)
+
+        try:
+            return response.json()
+        except ValueError:
+            # Шлюз может вернуть HTML или пустое тело вместо JSON
+            print(f'Ответ {response.status_code} от API не является JSON')
+            return None
+
+    def count_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def _load_calibration(self) -> float | None:
+        if not self.calibration_path:
+            return None
+        try:
+            with open(self.calibration_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        ratio = data.get(self.model)
+        return ratio if isinstance(ratio, (int, float)) and ratio > 0 else None
+
+    def _calibrate(self, prompt, usage: dict | None):
+        # Токенизатор удалённой модели недоступен: соотношение символов и токенов
+        # уточняется по полю usage ответов API
+        if not usage or not usage.get("prompt_tokens"):
+            return
+        chars = sum(len(m["content"]) for m in prompt)
+        observed = chars / usage["prompt_tokens"]
+        with self._calibration_lock:
+            current = self.observed_chars_per_token or self.chars_per_token
+            self.observed_chars_per_token = 0.8 * current + 0.2 * observed
+
+    def save_calibration(self, tolerance: float = 0.05):
+        # Небольшие колебания не сохраняются: иначе каждый запуск немного менял бы раскладку промптов
+        # и ключи кэша ответов на неизменённом коде
+        observed = self.observed_chars_per_token
+        if not self.calibration_path or observed is None:
+            return
+        if abs(observed - self.chars_per_token) <= tolerance * self.chars_per_token:
+            return
+        try:
+            with open(self.calibration_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            data = {}
+        data[self.model] = round(observed, 4)
+        directory = os.path.dirname(self.calibration_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.calibration_path)
 
     def generate(self, prompt) -> str | None:
         data = {
-            "model": "amazon/nova-2-lite-v1:free",
+            "model": self.model,
             'messages': prompt,
             'max_tokens': self.max_new_tokens,
         }
@@ -48,7 +163,10 @@ class Remote():
             print('Ошибка возврата LLM: ', json.dumps(prompt, indent=2, ensure_ascii=False))
             return None
 
-
+        usage = response.get("usage") or {}
+        metrics.inc("prompt_tokens", usage.get("prompt_tokens", 0), labels={"engine": self.name})
+        metrics.inc("completion_tokens", usage.get("completion_tokens", 0), labels={"engine": self.name})
+        self._calibrate(prompt, usage)
         message = choices[0]["message"]['content']
         return message if len(message) > 0 else None
 
@@ -63,7 +181,10 @@ class Remote():
 
     def is_requests_remaining(self) -> bool:
         limits = self.get_limits()
-        remaining = limits.get('data').get('limit_remaining')
-        if not remaining:
+        if not limits or not limits.get('data'):
+            return False
+        remaining = limits['data'].get('limit_remaining')
+        # None - у ключа нет лимита; 0 - квота исчерпана, и маршрутизатор должен переключиться на другой движок
+        if remaining is None:
             return True
-        return True if remaining > 0 else False
+        return remaining > 0
@@ -0,0 +1,198 @@
+import collections
+import threading
+import time
+
+from metrics import metrics
+
+
+class QuotaCache:
+    # Результат проверки квоты запоминается на ttl секунд, чтобы не обращаться к API на каждый чанк
+    def __init__(self, check, ttl: float = 60):
+        self.check = check
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._checked = float("-inf")
+        self._allowed = True
+
+    def allowed(self) -> bool:
+        with self._lock:
+            if time.monotonic() - self._checked >= self.ttl:
+                try:
+                    self._allowed = bool(self.check())
+                except Exception:
+                    self._allowed = False
+                self._checked = time.monotonic()
+                metrics.inc("router_quota_checks")
+            return self._allowed
+
+
+class EngineStats:
+    def __init__(self, slots: int, window: int):
+        self.slots = slots
+        self.busy = 0
+        self.latency = 0.0
+        self.outcomes = collections.deque(maxlen=window)
+        self.cooldown_until = 0.0
+
+    def failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class EngineRouter:
+    # Планировщик режима auto: каждый поток DocGenerator получает движок со свободным слотом.
+    # Удалённый движок работает в пределах своего лимита, локальный параллельно забирает
+    # остальные чанки; при ошибках, исчерпании квоты или высокой доле отказов
+    # запрос переходит на другой движок
+    name = "auto"
+
+    def __init__(self, factories: dict, slots: dict, quota_checks: dict | None = None, window: int = 20,
+                 min_samples: int = 3, failure_threshold: float = 0.5, cooldown: float = 30, alpha: float = 0.3):
+        self.factories = factories
+        self.quotas = quota_checks or {}
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+
+        self.stats = {name: EngineStats(slots[name], window) for name in factories}
+        self.max_concurrency = sum(slots[name] for name in factories)
+        self._engines = {}
+        self._disabled = set()
+        self._waiting = 0
+        self._backlog = 0
+        self._cond = threading.Condition()
+
+    def _engine(self, name: str):
+        # Движки создаются лениво; недоступный движок (нет зависимостей, весов или ключа) исключается
+        if name in self._engines:
+            return self._engines[name]
+        try:
+            engine = self.factories[name]()
+        except Exception as e:
+            print(f"Движок {name} недоступен: {e}")
+            metrics.inc("router_engine_disabled", labels={"engine": name})
+            with self._cond:
+                self._disabled.add(name)
+                self._cond.notify_all()
+            return None
+        self._engines[name] = engine
+        return engine
+
+    def _available(self) -> list:
+        names = [name for name in self.factories if name not in self._disabled and self._engine(name) is not None]
+        if not names:
+            raise RuntimeError("No generation engine is available")
+        return names
+
+    @property
+    def engine_id(self) -> str:
+        return "auto:" + "+".join(sorted(self._engine(name).engine_id for name in self._available()))
+
+    @property
+    def context_window(self) -> int:
+        return min(self._engine(name).context_window for name in self._available())
+
+    def count_tokens(self, text: str) -> int:
+        # Промпт должен поместиться в любой движок, поэтому берётся худшая оценка
+        return max(self._engine(name).count_tokens(text) for name in self._available())
+
+    def _healthy(self, name: str, now: float) -> bool:
+        stats = self.stats[name]
+        if now < stats.cooldown_until:
+            return False
+        quota = self.quotas.get(name)
+        return quota is None or quota.allowed()
+
+    def expect(self, count: int):
+        # Вызывающий код сообщает размер очереди чанков: по нему оценивается, успеет ли
+        # быстрый занятый движок разобрать очередь раньше медленного свободного
+        with self._cond:
+            self._backlog += count
+
+    def skip(self, count: int = 1):
+        # Ожидаемый запрос не дошёл до движков (ответ взят из кэша): очередь уменьшается,
+        # иначе в долгом процессе (--watch) она растёт и _pick начинает ждать медленный движок
+        with self._cond:
+            self._backlog = max(0, self._backlog - count)
+            self._cond.notify_all()
+
+    def _pick(self, candidates: list, healthy: list):
+        # Свободный движок с наименьшей латентностью. Если занятый движок успеет
+        # разобрать очередь быстрее, чем свободный выполнит запрос, лучше подождать его
+        pool = healthy or candidates
+        free = [name for name in pool if self.stats[name].busy < self.stats[name].slots]
+        if not free:
+            return None
+        best = min(free, key=lambda name: self.stats[name].latency)
+        queued = max(self._waiting, self._backlog)
+        for name in pool:
+            stats = self.stats[name]
+            if name not in free and stats.latency * (1 + queued / stats.slots) < self.stats[best].latency:
+                return None
+        return best
+
+    def _acquire(self, exclude: set):
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    candidates = [name for name in self.factories if name not in self._disabled and name not in exclude]
+                    if not candidates:
+                        if not exclude:
+                            self._backlog = max(0, self._backlog - 1)
+                        return None
+                    now = time.monotonic()
+                    # Проверка квоты может идти в сеть: условие на время проверки отпускается
+                    self._cond.release()
+                    try:
+                        healthy = [name for name in candidates if self._healthy(name, now)]
+                    finally:
+                        self._cond.acquire()
+                    name = self._pick(candidates, healthy)
+                    if name is not None:
+                        self.stats[name].busy += 1
+                        if not exclude:
+                            self._backlog = max(0, self._backlog - 1)
+                        return name
+                    self._cond.wait(timeout=1.0)
+            finally:
+                self._waiting -= 1
+
+    def _release(self, name: str, ok: bool, elapsed: float):
+        with self._cond:
+            stats = self.stats[name]
+            stats.busy -= 1
+            stats.outcomes.append(ok)
+            if ok:
+                stats.latency = elapsed if not stats.latency else (1 - self.alpha) * stats.latency + self.alpha * elapsed
+            elif len(stats.outcomes) >= self.min_samples and stats.failure_rate() >= self.failure_threshold:
+                stats.cooldown_until = time.monotonic() + self.cooldown
+                stats.outcomes.clear()
+                metrics.inc("router_cooldowns", labels={"engine": name})
+                print(f"Движок {name}: слишком много ошибок, пауза {self.cooldown:.0f} с")
+            self._cond.notify_all()
+
+    def generate(self, prompt) -> str | None:
+        tried = set()
+        while True:
+            name = self._acquire(tried)
+            if name is None:
+                return None
+            engine = self._engine(name)
+            result = None
+            start = time.perf_counter()
+            try:
+                if engine is not None:
+                    result = engine.generate(prompt)
+            except Exception as e:
+                print(f"Ошибка движка {name}: {e}")
+            elapsed = time.perf_counter() - start
+            self._release(name, bool(result), elapsed)
+            metrics.inc("router_dispatch", labels={"engine": name, "ok": bool(result)})
+            metrics.observe("router_engine_seconds", elapsed, {"engine": name})
+            if result:
+                return result
+            tried.add(name)
+            metrics.inc("router_failovers")
@@ -0,0 +1,187 @@
+import ast
+import hashlib
+import json
+import os
+import tempfile
+from typing import List, Tuple
+
+from metrics import metrics
+from models import EndPoint
+
+INDEX_VERSION = 2
+
+
+def extract_functions(content: str, max_lines: int = 30, max_chars: int = 800) -> List[Tuple[str, str]]:
+    # Все функции и методы файла: (короткое имя, фрагмент исходного кода)
+    tree = ast.parse(content)
+    lines = content.splitlines()
+    result = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            end = min(node.end_lineno, node.lineno + max_lines - 1)
+            body = '\n'.join(lines[node.lineno - 1:end])[:max_chars]
+            result.append((node.name, body))
+    return result
+
+
+class RagIndex:
+    # Эмбеддинги функций проекта в FAISS-индексе на диске. Индекс обновляется по хэшу файлов:
+    # пересчитываются только новые и изменённые файлы
+    def __init__(self, index_dir: str, model_name: str, top_k: int = 3, batch_size: int = 64,
+                 max_body_lines: int = 30, max_body_chars: int = 800):
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.max_body_lines = max_body_lines
+        self.max_body_chars = max_body_chars
+
+        self._model = None
+        self.index = None
+        # names - карта "имя функции -> id", поддерживается при обновлении и хранится вместе с индексом,
+        # чтобы attach не перебирал все функции проекта на каждом вызове
+        self.meta = {"version": INDEX_VERSION, "model": model_name, "next_id": 0, "files": {}, "functions": {},
+                     "names": {}}
+        self._dirty = False
+        self._load()
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.index_dir, "index.faiss")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.index_dir, "meta.json")
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def _load(self):
+        import faiss
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != INDEX_VERSION or meta.get("model") != self.model_name:
+                return
+            index = faiss.read_index(self._index_path)
+        except (OSError, RuntimeError, json.JSONDecodeError):
+            return
+        self.meta = meta
+        self.index = index
+
+    def save(self):
+        import faiss
+        if not self._dirty:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        if self.index is not None:
+            faiss.write_index(self.index, self._index_path)
+        fd, tmp_path = tempfile.mkstemp(dir=self.index_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path)
+        self._dirty = False
+
+    def _embed(self, texts: List[str]):
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False).astype("float32")
+
+    def _remove_file(self, file_path: str):
+        import numpy as np
+        entry = self.meta["files"].pop(file_path, None)
+        if entry is None:
+            return
+        self._dirty = True
+        if self.index is not None:
+            self.index.remove_ids(np.array(entry["ids"], dtype="int64"))
+        names = self.meta["names"]
+        for function_id in entry["ids"]:
+            function = self.meta["functions"].pop(str(function_id), None)
+            if function is None:
+                continue
+            ids = names.get(function["name"], [])
+            if str(function_id) in ids:
+                ids.remove(str(function_id))
+            if not ids:
+                names.pop(function["name"], None)
+
+    def update(self, file_paths: List[str]):
+        import faiss
+        import numpy as np
+
+        file_paths = [os.path.abspath(p) for p in file_paths]
+        for stale in set(self.meta["files"]) - set(file_paths):
+            self._remove_file(stale)
+
+        new_ids, new_texts = [], []
+        for file_path in file_paths:
+            try:
+                with open(file_path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            file_hash = hashlib.sha256(data).hexdigest()
+            entry = self.meta["files"].get(file_path)
+            if entry and entry["hash"] == file_hash:
+                continue
+
+            self._remove_file(file_path)
+            try:
+                functions = extract_functions(data.decode("utf-8", errors="ignore"),
+                                              self.max_body_lines, self.max_body_chars)
+            except (SyntaxError, ValueError):
+                functions = []
+
+            ids = []
+            for name, body in functions:
+                function_id = self.meta["next_id"]
+                self.meta["next_id"] += 1
+                self.meta["functions"][str(function_id)] = {"file": file_path, "name": name, "body": body}
+                self.meta["names"].setdefault(name, []).append(str(function_id))
+                ids.append(function_id)
+                new_ids.append(function_id)
+                new_texts.append(body)
+            self.meta["files"][file_path] = {"hash": file_hash, "ids": ids}
+            self._dirty = True
+
+        if new_texts:
+            vectors = self._embed(new_texts)
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+            self.index.add_with_ids(vectors, np.array(new_ids, dtype="int64"))
+        metrics.inc("rag_functions_embedded", len(new_texts))
+        print(f"RAG-индекс: функций {len(self.meta['functions'])}, пересчитано {len(new_texts)}")
+        self.save()
+
+    def attach(self, notation: List[Tuple[str, List[EndPoint]]]):
+        # Для каждого эндпоинта подбираются тела вспомогательных функций:
+        # сначала совпадения по именам из calls, затем ближайшие по эмбеддингу
+        endpoints = [e for _, methods in notation for e in methods]
+        if not endpoints or self.index is None or self.index.ntotal == 0:
+            return
+
+        by_name = self.meta["names"]
+        queries = [f"{e.function} {' '.join(e.calls)}\n{e.code_snippet}" for e in endpoints]
+        _, neighbours = self.index.search(self._embed(queries), self.top_k + 1)
+
+        for endpoint, ids in zip(endpoints, neighbours):
+            candidates = []
+            for call in endpoint.calls:
+                candidates.extend(by_name.get(call.split(".")[-1], []))
+            candidates.extend(str(i) for i in ids if i >= 0)
+
+            context = []
+            seen = set()
+            for function_id in candidates:
+                function = self.meta["functions"].get(function_id)
+                if function is None or function_id in seen or function["name"] == endpoint.function:
+                    continue
+                seen.add(function_id)
+                context.append(function["body"])
+                if len(context) >= self.top_k:
+                    break
+            endpoint.context = context
@@ -1,12 +1,18 @@
 import json
 import os
+import threading
 import time
 
-from localLLM import Local
-from remoteLLM import Remote
+from metrics import metrics
+from pipeline.utils import serialize_endpoints
+from services.engineRouter import EngineRouter, QuotaCache
+from services.responseCache import ResponseCache
+
+# Служебные токены чат-шаблона на одно сообщение
+MESSAGE_OVERHEAD_TOKENS = 8
 
 class GenerationService:
-    def __init__(self, mode: str):
+    def __init__(self, mode: str, use_cache: bool = True, clear_cache: bool = False, engine=None):
         file_path = os.path.abspath(__file__)
         root_path = os.path.dirname(os.path.dirname(os.path.dirname(file_path)))
         config_path = os.path.join(root_path, 'config', 'cfg.json')
@@ -20,36 +26,197 @@ class GenerationService:
         self.user = self.prompt_settings["user"]
         self.few_shot = self.prompt_settings["few_shot"]
 
+        self.generation_hints = config["generation_hints"]
         self.num_beams = config["generation_hints"]["num_beams"]
         self.repetition_penalty = config["generation_hints"]["repetition_penalty"]
         self.max_new_tokens = config["generation_hints"]["max_new_tokens"]
         self.temperature = config["generation_hints"]["temperature"]
         self.top_p = config["generation_hints"]["top_p"]
 
-        self.do_sample = True
+        self.do_sample = config["generation_hints"]["do_sample"]
+
+        cache_settings = config["cache"]
+        self.cache = ResponseCache(os.path.join(root_path, cache_settings["dir"]),
+                                   max_size_mb=cache_settings["max_size_mb"],
+                                   max_age_days=cache_settings["max_age_days"],
+                                   enabled=use_cache)
+        if clear_cache:
+            self.cache.clear()
+
+        self.concurrency = config["concurrency"]
+        self._limits = {name: threading.BoundedSemaphore(limit) for name, limit in self.concurrency.items()}
+
+        self.local_settings = config["local"]
+        self.remote_settings = config["remote"]
+        self.calibration_path = os.path.join(root_path, self.remote_settings["calibration_file"])
+        self.rag_settings = config["rag"]
+        self.router_settings = config["router"]
+        self.output_tokens_per_endpoint = config["packing"]["output_tokens_per_endpoint"]
+
+        # Движки создаются при первом обращении: torch/transformers и веса модели
+        # загружаются только если действительно нужна локальная генерация
+        self._local = None
+        self._remote = None
+        self._router = None
+        self._engine_lock = threading.Lock()
+        self._prefix_tokens = {}
+
+        # Внешний движок (например, тестовый) заменяет выбор между local и remote
+        self.engine = engine
+        if engine is not None:
+            self._limits.setdefault(engine.name, threading.BoundedSemaphore(getattr(engine, "max_concurrency", 1)))
+
+    @property
+    def local(self):
+        with self._engine_lock:
+            if self._local is None:
+                from localLLM import Local
+                self._local = Local(self.repetition_penalty, self.max_new_tokens, self.temperature, self.top_p, self.num_beams, self.do_sample,
+                                    batch_size=self.local_settings["batch_size"], prefix_cache=self.local_settings["prefix_cache"],
+                                    context_window=self.local_settings["context_window"],
+                                    constrained_json=self.local_settings["constrained_json"],
+                                    constraint_top_k=self.local_settings["constraint_top_k"])
+            return self._local
 
-        self.local = Local(self.repetition_penalty, self.max_new_tokens, self.temperature, self.top_p, self.num_beams, self.do_sample)
-        self.remote = Remote(self.repetition_penalty, self.max_new_tokens, self.temperature, self.top_p, self.num_beams, self.do_sample)
+    @property
+    def remote(self):
+        with self._engine_lock:
+            if self._remote is None:
+                from remoteLLM import Remote
+                self._remote = Remote(self.repetition_penalty, self.max_new_tokens, self.temperature, self.top_p, self.num_beams, self.do_sample,
+                                      max_connections=self.concurrency["remote"],
+                                      context_window=self.remote_settings["context_window"],
+                                      chars_per_token=self.remote_settings["chars_per_token"],
+                                      calibration_path=self.calibration_path)
+            return self._remote
 
     def _isRemoteEnabled(self):
         return True if self.remote.is_requests_remaining() else False
 
+    @property
+    def router(self):
+        with self._engine_lock:
+            if self._router is None:
+                settings = self.router_settings
+                self._router = EngineRouter({"remote": lambda: self.remote, "local": lambda: self.local},
+                                            slots=self.concurrency,
+                                            quota_checks={"remote": QuotaCache(self._isRemoteEnabled, settings["quota_ttl"])},
+                                            window=settings["window"], min_samples=settings["min_samples"],
+                                            failure_threshold=settings["failure_threshold"],
+                                            cooldown=settings["cooldown"])
+                self._limits.setdefault(self._router.name, threading.BoundedSemaphore(self._router.max_concurrency))
+            return self._router
+
+    def save_state(self):
+        # Соотношение символов и токенов, уточнённое за запуск, применяется со следующего запуска
+        if self._remote is not None:
+            self._remote.save_calibration()
+
     def _select_engine(self):
+        if self.engine is not None:
+            return self.engine
         if self.mode == "local":
             return self.local
         elif self.mode == "remote":
             return self.remote
-        return self.remote if self._isRemoteEnabled else self.local
+        # В режиме auto чанки распределяет маршрутизатор между обоими движками
+        return self.router
 
-    def generate(self, input):
+    def generate(self, input, accept=None):
         gen = self._select_engine()
-        prompt = self._build_prompt(input)
-        result = gen.generate(prompt)
+        with metrics.span("prompt_build"):
+            prompt = self._build_prompt(input)
+
+        key = self.cache.make_key(gen.engine_id, prompt, self.generation_hints)
+        cached = self.cache.get(key)
+        if cached is not None:
+            if gen is self._router:
+                gen.skip()
+            return cached
+
+        with self._limits[gen.name]:
+            start = time.perf_counter()
+            result = gen.generate(prompt)
+            metrics.observe("llm_call_seconds", time.perf_counter() - start, {"engine": gen.name})
+        metrics.inc("llm_calls", labels={"engine": gen.name})
         if not result:
             print('Ошибка при генерации ответа.')
             return None
+        # Ответ, который вызывающий код не смог разобрать, в кэш не попадает,
+        # иначе повторный запрос получил бы тот же испорченный ответ
+        if accept is None or accept(result):
+            self.cache.set(key, result)
         return result
 
+    def parallel_slots(self) -> int:
+        # Сколько запросов движок может выполнять одновременно; 0 - ограничение задаёт вызывающий код
+        return self.router.max_concurrency if self.engine is None and self.mode == "auto" else 0
+
+    def expect_requests(self, count: int):
+        if self.parallel_slots():
+            self.router.expect(count)
+
+    def supports_batching(self) -> bool:
+        return hasattr(self._select_engine(), "generate_batch")
+
+    def generate_batch(self, inputs: list, accept=None) -> list:
+        gen = self._select_engine()
+        with metrics.span("prompt_build"):
+            prompts = [self._build_prompt(input) for input in inputs]
+        keys = [self.cache.make_key(gen.engine_id, prompt, self.generation_hints) for prompt in prompts]
+
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        with self._limits[gen.name]:
+            start = time.perf_counter()
+            generated = gen.generate_batch([prompts[i] for i in missing])
+            # Для батча латентность одного вызова делится поровну между промптами
+            per_prompt = (time.perf_counter() - start) / len(missing)
+        for _ in missing:
+            metrics.observe("llm_call_seconds", per_prompt, {"engine": gen.name})
+        metrics.inc("llm_calls", len(missing), labels={"engine": gen.name})
+
+        for i, result in zip(missing, generated):
+            if not result:
+                print('Ошибка при генерации ответа.')
+                continue
+            if accept is None or accept(result):
+                self.cache.set(keys[i], result)
+            results[i] = result
+        return results
+
+    def serialize_input(self, input) -> str:
+        return serialize_endpoints(input)
+
+    def count_tokens(self, text: str) -> int:
+        return self._select_engine().count_tokens(text)
+
+    def _prefix_token_count(self, gen) -> int:
+        # Системное сообщение и few-shot примеры одинаковы для всех промптов: считаются один раз на движок
+        if gen.engine_id not in self._prefix_tokens:
+            prefix = self._build_prompt([])[:-1]
+            self._prefix_tokens[gen.engine_id] = sum(gen.count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS
+                                                     for m in prefix)
+        return self._prefix_tokens[gen.engine_id]
+
+    def estimate_prompt_tokens(self, input) -> int:
+        gen = self._select_engine()
+        last = self._build_prompt(input)[-1]
+        return self._prefix_token_count(gen) + gen.count_tokens(last["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def prompt_limit(self) -> int:
+        return self._select_engine().context_window - self.max_new_tokens
+
+    def prompt_budget(self) -> int:
+        # Токены, доступные под эндпоинты после префикса промпта и max_new_tokens
+        return self.prompt_limit() - self.estimate_prompt_tokens([])
+
+    def max_endpoints_per_prompt(self) -> int:
+        return max(1, self.max_new_tokens // self.output_tokens_per_endpoint)
+
     def _build_prompt(self, input):
         messages = []
         messages.append(self.system)
@@ -58,5 +225,5 @@ class GenerationService:
             messages.append(ex["user"])
             messages.append(ex["assistant"])
 
-        messages.append({"role": "user", "content": "Вот компактный список эндпоинтов:\n" + str(input)})
+        messages.append({"role": "user", "content": "Вот компактный список эндпоинтов:\n" + self.serialize_input(input)})
         return messages
@@ -0,0 +1,45 @@
+import ast
+import inspect
+
+import pytest
+
+from models import EndPoint
+from pipeline.client_generator import ClientGenerator
+
+# Ответы LLM часто содержат кавычки, в том числе в начале и в конце текста
+DOC_TEXTS = [
+    ('Returns "x"', ''),
+    ('"Quoted" summary', 'Ends with a quote: "done"'),
+    ('Triple """ inside', 'Backslash at the end \\'),
+    ('', '""'),
+    ("Mixed 'single' and \"double\" quotes", 'Braces {id} and a newline\n"last line"'),
+]
+
+
+def _endpoint(summary: str, description: str) -> EndPoint:
+    return EndPoint(function="get_item", path="/items/<int:item_id>",
+                    params=[{"name": "item_id", "type": "int"}, {"name": "q", "type": "str"}],
+                    methods=["GET", "POST"], summary=summary, description=description, calls=[], code_snippet="")
+
+
+def _load_class(source: str, name: str):
+    # requests/httpx для проверки тел методов не нужны: импорты отбрасываются
+    tree = ast.parse(source)
+    tree.body = [node for node in tree.body if not isinstance(node, (ast.Import, ast.ImportFrom))]
+    namespace = {}
+    exec(compile(tree, "client.py", "exec"), namespace)
+    return namespace[name]
+
+
+@pytest.mark.parametrize("summary,description", DOC_TEXTS)
+@pytest.mark.parametrize("async_client", [False, True])
+def test_generated_client_compiles_with_quoted_docs(summary, description, async_client):
+    generator = ClientGenerator()
+    endpoints = [_endpoint(summary, description)]
+    source = generator.create_async_client(endpoints) if async_client else generator.create_client(endpoints)
+    compile(source, "client.py", "exec")
+
+    cls = _load_class(source, "AsyncApiClient" if async_client else "ApiClient")
+    expected = "\n\n".join(part for part in (summary, description) if part)
+    for method in (cls.get_item_get, cls.get_item_post):
+        assert inspect.cleandoc(method.__doc__ or "") == expected
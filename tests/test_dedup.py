@@ -0,0 +1,43 @@
+from models import EndPoint
+from pipeline.dedup import deduplicate, fan_out
+
+
+def _endpoint(function: str, path: str, fingerprint: str = "same") -> EndPoint:
+    return EndPoint(function=function, path=path, params=[], methods=["GET"], summary="", description="",
+                    calls=[], code_snippet="", fingerprint=fingerprint)
+
+
+def _fan_out(summary: str, description: str = "", rep=("get", "/u"), member=("list_all", "/u/archive")):
+    representative, duplicate = _endpoint(*rep), _endpoint(*member)
+    notations = [("a.py", [representative]), ("b.py", [duplicate])]
+    pending, groups = deduplicate(notations)
+    assert pending == [("a.py", [representative])]
+    documentation = {"a.py": [{"method": f"GET {rep[1]}", "summary": summary, "description": description}]}
+    docs = fan_out(documentation, groups)["b.py"]
+    assert len(docs) == 1 and docs[0]["method"] == f"GET {member[1]}"
+    return docs[0]
+
+
+def test_fan_out_keeps_words_containing_the_function_name():
+    doc = _fan_out("Get the target user budget", "Calls get() and returns the widget.")
+    assert doc["summary"] == "Get the target user budget"
+    assert doc["description"] == "Calls list_all() and returns the widget."
+
+
+def test_fan_out_replaces_only_whole_paths():
+    doc = _fan_out("Lists /u.", "Unlike /users and /u/old, GET /u returns `/u` items; see /u?page=2")
+    assert doc["summary"] == "Lists /u/archive."
+    assert doc["description"] == ("Unlike /users and /u/old, GET /u/archive returns `/u/archive` items; "
+                                  "see /u/archive?page=2")
+
+
+def test_fan_out_does_not_rewrite_substituted_path():
+    # Новый путь содержит имя функции представителя: повторной замены внутри него быть не должно
+    doc = _fan_out("get handles /u", rep=("get", "/u"), member=("fetch", "/get/u"))
+    assert doc["summary"] == "fetch handles /get/u"
+
+
+def test_unique_fingerprints_are_not_grouped():
+    notations = [("a.py", [_endpoint("a", "/a", "x")]), ("b.py", [_endpoint("b", "/b", "y")])]
+    pending, groups = deduplicate(notations)
+    assert groups == [] and pending == notations
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from localLLM import Local
+
+# Крошечный чекпоинт со случайными весами: проверяется совпадение вычислений, а не качество ответа
+CHECKPOINT = os.getenv("PREFIX_CACHE_TEST_CHECKPOINT", "hf-internal-testing/tiny-random-LlamaForCausalLM")
+CHAT_TEMPLATE = ("{% for m in messages %}<|{{ m['role'] }}|>\n{{ m['content'] }}\n{% endfor %}"
+                 "{% if add_generation_prompt %}<|assistant|>\n{% endif %}")
+
+PREFIX = [
+    {"role": "system", "content": "Describe every endpoint as JSON."},
+    {"role": "user", "content": '[{"function":"ping","path":"/ping","methods":["GET"]}]'},
+    {"role": "assistant", "content": '<JSON>[{"method":"GET /ping","summary":"Ping","description":"Health"}]</JSON>'},
+]
+SUFFIXES = [
+    '[{"function":"get_user","path":"/users/<int:user_id>","methods":["GET"],"params":["user_id:int"]}]',
+    '[{"function":"list_items","path":"/items","methods":["GET"]}]',
+    '[{"function":"create_order","path":"/orders","methods":["POST"],"params":["items:list","note:str"],'
+    '"calls":["db.session.add","db.session.commit"]}]',
+]
+
+
+@pytest.fixture(scope="module")
+def engine():
+    torch.manual_seed(0)
+    try:
+        local = Local(repetition_penalty=1.0, max_new_tokens=12, temperature=1.0, top_p=1.0, num_beams=1,
+                      do_sample=False, batch_size=4, checkpoint=CHECKPOINT)
+    except OSError as e:
+        pytest.skip(f"checkpoint {CHECKPOINT} unavailable: {e}")
+    if not local.tokenizer.chat_template:
+        local.tokenizer.chat_template = CHAT_TEMPLATE
+    local.model.eval()
+    return local
+
+
+def _generate(engine, messages_list: list, prefix_cache: bool) -> list:
+    engine.prefix_cache = prefix_cache
+    engine._prefix = None
+    return engine.generate_batch(messages_list)
+
+
+@pytest.mark.parametrize("count", [1, len(SUFFIXES)])
+def test_greedy_output_matches_without_prefix_cache(engine, count):
+    messages_list = [PREFIX + [{"role": "user", "content": suffix}] for suffix in SUFFIXES[:count]]
+    assert engine._encode_with_prefix(messages_list, [
+        engine.tokenizer.apply_chat_template(m, tokenize=False, add_generation_prompt=True) for m in messages_list
+    ]) is not None, "prefix cache was not applied"
+
+    cached = _generate(engine, messages_list, prefix_cache=True)
+    plain = _generate(engine, messages_list, prefix_cache=False)
+    assert cached == plain